@@ -25,6 +25,7 @@ data "aws_iam_policy_document" "lambda_role_policy_document" {
       "s3:Get*",
       "s3:List*",
       "s3:Put*",
+      "s3:AbortMultipartUpload",
       "secretsmanager:DescribeSecret",
       "secretsmanager:GetSecretValue",
       "dynamodb:*",
@@ -0,0 +1,88 @@
+"""
+Benchmark lambda-utils cold start: each run is a fresh interpreter timing
+the import of the layer modules and the first s3_download, as a handler
+that only needs s3 would see it.
+
+    python src/benchmarks/bench_cold_start.py --runs 10
+"""
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+from argparse import ArgumentParser
+
+from bench_utils import LAMBDA_UTILS_DIR, local_aws, write_results
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+COLD_START = """
+import json, sys, time
+sys.path.insert(0, {utils_dir!r})
+start = time.perf_counter()
+import s3, dynamodb, secrets_manager
+imported = time.perf_counter()
+s3.s3_download({bucket!r}, "object", {local_path!r}, force=True)
+first_call = time.perf_counter()
+print(json.dumps({{"import": imported - start, "first_call": first_call - imported}}))
+"""
+
+
+def main():
+    """
+    bench cold start
+    """
+    parser = ArgumentParser(prog="bench_cold_start")
+    parser.add_argument("--endpoint-url")
+    parser.add_argument("--bucket", default="bench-cold-start")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("-o", "--output")
+    args = parser.parse_args()
+
+    with local_aws(args.endpoint_url):
+        import boto3  # pylint: disable=import-outside-toplevel
+
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(
+            Bucket=args.bucket,
+            CreateBucketConfiguration={"LocationConstraint": os.environ["AWS_REGION"]},
+        )
+        s3_client.put_object(Bucket=args.bucket, Key="object", Body=b"{}")
+
+        code = COLD_START.format(
+            utils_dir=LAMBDA_UTILS_DIR,
+            bucket=args.bucket,
+            local_path=f"/tmp/{args.bucket}/object",
+        )
+        samples = []
+        for _ in range(args.runs):
+            out = subprocess.run(
+                [sys.executable, "-c", code],
+                check=True,
+                capture_output=True,
+                text=True,
+            )
+            samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    for sample in samples:
+        sample["total"] = sample["import"] + sample["first_call"]
+
+    rows = []
+    for phase in ("import", "first_call", "total"):
+        values = [sample[phase] for sample in samples]
+        rows.append(
+            {
+                "phase": phase,
+                "runs": len(values),
+                "median_sec": statistics.median(values),
+                "min_sec": min(values),
+                "max_sec": max(values),
+            }
+        )
+    write_results("cold_start", rows, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Micro-benchmark dynamodb item deserialization on prompt-table like items:
+per value TypeDeserializer (the previous path) against the fast path
+deserialize_items, with Decimal and with native numbers.
+
+    python src/benchmarks/bench_deserialize.py --items 1000 --repeat 20
+"""
+import logging
+import timeit
+from argparse import ArgumentParser
+
+from bench_utils import make_prompts, setup_env, write_results
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def make_db_items(count):
+    """
+    make_db_items prompt and prompt result items in dynamodb wire format
+    """
+    prompts, _ = make_prompts(count)
+    db_items = []
+    for i, prompt in enumerate(prompts):
+        db_item = {k: {"S": v} for k, v in prompt.items()}
+        db_item.update(
+            {
+                "created_at": {"N": str(1700000000 + i)},
+                "ttl": {"N": str(1700604800 + i)},
+                "score": {"N": "0.75"},
+                "enabled": {"BOOL": True},
+                "options": {
+                    "M": {
+                        "engine": {"S": "openai"},
+                        "temperature": {"N": "0.5"},
+                        "max_tokens": {"N": "512"},
+                    }
+                },
+                "tags": {"L": [{"S": "text"}, {"S": "en"}, {"S": f"t{i % 7}"}]},
+            }
+        )
+        db_items.append(db_item)
+    return db_items
+
+
+def main():
+    """
+    bench deserialize
+    """
+    parser = ArgumentParser(prog="bench_deserialize")
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("-o", "--output")
+    args = parser.parse_args()
+
+    setup_env()
+    import dynamodb  # pylint: disable=import-outside-toplevel
+
+    db_items = make_db_items(args.items)
+    deserializer = dynamodb.db_deserializer
+
+    def type_deserializer():
+        return [
+            {k: deserializer.deserialize(v) for k, v in db_item.items()}
+            for db_item in db_items
+        ]
+
+    assert dynamodb.deserialize_items(db_items, False) == type_deserializer()
+
+    cases = {
+        "TypeDeserializer": type_deserializer,
+        "deserialize_items": lambda: dynamodb.deserialize_items(db_items, False),
+        "deserialize_items_native": lambda: dynamodb.deserialize_items(db_items, True),
+    }
+    rows = []
+    baseline = None
+    for name, func in cases.items():
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        baseline = baseline or best
+        rows.append(
+            {
+                "path": name,
+                "items": args.items,
+                "ms": best * 1000,
+                "us_per_item": best * 1e6 / args.items,
+                "speedup": baseline / best,
+            }
+        )
+
+    write_results("deserialize", rows, args.output)
+
+
+if __name__ == "__main__":
+    main()
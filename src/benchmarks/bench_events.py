@@ -0,0 +1,157 @@
+"""
+Benchmark event record parsing on large synthetic S3 and dynamodb stream
+batches: the previous per record path (reduce over split keys, sanity check
+logged at INFO) against compiled extractors per record and parse_records.
+
+    python src/benchmarks/bench_events.py --records 100,1000,10000
+"""
+import logging
+import timeit
+from argparse import ArgumentParser
+from functools import reduce
+
+from bench_utils import setup_env, write_results
+
+logger = logging.getLogger(__name__)
+
+ARN = "arn:aws:dynamodb:us-west-2:123456789012:table/prompt-results-table/stream/x"
+
+
+def s3_record(i):
+    """
+    s3_record as delivered by s3 notifications
+    """
+    return {
+        "eventVersion": "2.1",
+        "eventSource": "aws:s3",
+        "awsRegion": "us-west-2",
+        "eventTime": "2023-01-01T00:00:00.000Z",
+        "eventName": "ObjectCreated:Put",
+        "userIdentity": {"principalId": "AWS:EXAMPLE"},
+        "requestParameters": {"sourceIPAddress": "127.0.0.1"},
+        "responseElements": {"x-amz-request-id": f"req-{i}"},
+        "s3": {
+            "s3SchemaVersion": "1.0",
+            "configurationId": "lambda-image-scale",
+            "bucket": {
+                "name": "lambda-image-scale-bucket-us-west-2",
+                "ownerIdentity": {"principalId": "EXAMPLE"},
+                "arn": "arn:aws:s3:::lambda-image-scale-bucket-us-west-2",
+            },
+            "object": {
+                "key": f"input/{i:08d}.jpg",
+                "size": 1024 * i,
+                "eTag": f"{i:032x}",
+                "sequencer": f"{i:016X}",
+            },
+        },
+    }
+
+
+def stream_record(i):
+    """
+    stream_record as delivered by dynamodb streams
+    """
+    return {
+        "eventID": f"{i:032x}",
+        "eventName": "REMOVE",
+        "eventVersion": "1.1",
+        "eventSource": "aws:dynamodb",
+        "awsRegion": "us-west-2",
+        "dynamodb": {
+            "ApproximateCreationDateTime": 1700000000 + i,
+            "Keys": {"id": {"S": f"res-{i:08d}"}},
+            "OldImage": {
+                "id": {"S": f"res-{i:08d}"},
+                "prompt_id": {"S": f"prompt-{i % 100:06d}"},
+                "ttl": {"N": str(1700000000 + i)},
+            },
+            "SequenceNumber": f"{i:021d}",
+            "SizeBytes": 120,
+            "StreamViewType": "NEW_AND_OLD_IMAGES",
+        },
+        "eventSourceARN": ARN,
+    }
+
+
+def legacy_process(record, type_key, event_keys):
+    """
+    legacy_process the per record path before compiled extractors
+    """
+    logger.info("event_sanity_check >> type_key :%s", type_key)
+    if type_key not in record:
+        return False
+    job = {
+        "eventType": type_key,
+        "eventSource": record["eventSource"],
+        "eventName": record["eventName"],
+    }
+    for name, key_ in event_keys.items():
+        value_ = reduce(
+            lambda d, key: d.get(key) if isinstance(d, dict) else None,
+            key_.split("."),
+            record,
+        )
+        if value_:
+            job[name] = value_
+    logger.info("event_process >> job :%s", job)
+    return job
+
+
+def main():
+    """
+    bench events
+    """
+    parser = ArgumentParser(prog="bench_events")
+    parser.add_argument("--records", default="100,1000,10000")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("-o", "--output")
+    args = parser.parse_args()
+
+    setup_env()
+    import events  # pylint: disable=import-outside-toplevel
+
+    logging.basicConfig(level=logging.WARNING)
+    s3_keys = {"s3ObjectKey": "s3.object.key", "s3BucketName": "s3.bucket.name"}
+    stream_keys = {
+        "prompt_id": "dynamodb.OldImage.prompt_id.S",
+        "id": "dynamodb.Keys.id.S",
+        "eventSourceARN": "eventSourceARN",
+    }
+
+    rows = []
+    for count in [int(c) for c in args.records.split(",")]:
+        for kind, make, type_key, keys, parse_one in (
+            ("s3", s3_record, "s3", s3_keys, events.s3_event),
+            (
+                "dynamodb",
+                stream_record,
+                "dynamodb",
+                stream_keys,
+                events.dyanamodb_stream_event,
+            ),
+        ):
+            records = [make(i) for i in range(count)]
+
+            def best(func):
+                return min(timeit.repeat(func, number=1, repeat=args.repeat))
+
+            legacy = best(lambda: [legacy_process(r, type_key, keys) for r in records])
+            per_record = best(lambda: [parse_one(r) for r in records])
+            batch = best(lambda: events.parse_records(records))
+            rows.append(
+                {
+                    "kind": kind,
+                    "records": count,
+                    "legacy_us": legacy / count * 1e6,
+                    "per_record_us": per_record / count * 1e6,
+                    "parse_records_us": batch / count * 1e6,
+                    "speedup": legacy / batch,
+                }
+            )
+
+    write_results("events", rows, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+Benchmark suite for the lambda-utils layer, run offline against local
+stand-ins. For tracking regressions between layer builds it records:
+
+    imports  - per module import time (python -X importtime) and peak RSS
+    helpers  - first call (fresh interpreter) versus steady state latency of
+               each public helper, and peak RSS
+
+    python src/benchmarks/bench_layer.py -o bench_layer.json
+    python src/benchmarks/bench_layer.py --helpers dynamodb.get_item,s3.s3_open
+"""
+import importlib
+import json
+import logging
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import SUPPRESS, ArgumentParser
+
+from bench_utils import (
+    LAMBDA_UTILS_DIR,
+    SRC_DIR,
+    create_prompt_tables,
+    local_aws,
+    make_prompts,
+    setup_env,
+    write_results,
+)
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+BUCKET = "bench-layer"
+SECRET = "bench-layer-secret"
+S3_RECORD = {
+    "eventSource": "aws:s3",
+    "eventName": "ObjectCreated:Put",
+    "s3": {
+        "bucket": {"name": BUCKET},
+        "object": {"key": "manifest.json"},
+    },
+}
+
+
+def _events_s3_event():
+    import events  # pylint: disable=import-outside-toplevel
+
+    return lambda: events.s3_event(S3_RECORD)
+
+
+def _s3_download():
+    import s3  # pylint: disable=import-outside-toplevel
+
+    return lambda: s3.s3_download(BUCKET, "manifest.json")
+
+
+def _s3_open():
+    import s3  # pylint: disable=import-outside-toplevel
+
+    def read():
+        with s3.s3_open(f"s3://{BUCKET}/manifest.json", "r") as json_fp:
+            return json.load(json_fp)
+
+    return read
+
+
+def _s3_upload():
+    import s3  # pylint: disable=import-outside-toplevel
+
+    with tempfile.NamedTemporaryFile("wb", delete=False) as upload_file:
+        upload_file.write(b"{}" * 512)
+    return lambda: s3.s3_upload(upload_file.name, BUCKET, "output.json")
+
+
+def _dynamodb_get_item():
+    import dynamodb  # pylint: disable=import-outside-toplevel
+
+    return lambda: dynamodb.get_item("prompts-table", "prompt-000001")
+
+
+def _dynamodb_get_items():
+    import dynamodb  # pylint: disable=import-outside-toplevel
+
+    ids = [f"prompt-{i:06d}" for i in range(20)]
+    return lambda: dynamodb.get_items("prompts-table", ids)
+
+
+def _dynamodb_query():
+    import dynamodb  # pylint: disable=import-outside-toplevel
+
+    expr = {
+        "condition": "task_ = :task AND type_ = :type",
+        "values": {":task": {"S": "task-1"}, ":type": {"S": "text"}},
+        "cols": "prompt_ids",
+    }
+    return lambda: dynamodb.query("prompt-lookup-table", "task-type", expr, True, 1)
+
+
+def _dynamodb_put_item():
+    import dynamodb  # pylint: disable=import-outside-toplevel
+
+    item = {"id": "res-bench", "prompt_id": "prompt-000001", "result": "x" * 1024}
+    return lambda: dynamodb.put_item("prompt-results-table", item)
+
+
+def _dynamodb_update_item():
+    import dynamodb  # pylint: disable=import-outside-toplevel
+
+    key = {"id": "prompt-000002"}
+    return lambda: dynamodb.update_item("prompts-table", key, {"res_id": "res-0"})
+
+
+def _prompts_get_prompt():
+    import prompts  # pylint: disable=import-outside-toplevel
+
+    return lambda: prompts.get_prompt("prompt-000003")
+
+
+def _prompts_get_prompts():
+    import prompts  # pylint: disable=import-outside-toplevel
+
+    return lambda: prompts.get_prompts("task-2", "text")
+
+
+def _secrets_manager_get_secret():
+    # pylint: disable=import-outside-toplevel
+    from secrets_manager import SecretManager
+
+    SecretManager._cache_path = tempfile.mktemp()  # pylint: disable=protected-access
+    return lambda: SecretManager.get_secret(SECRET)
+
+
+def _lambda_handler():
+    sys.path.insert(0, os.path.join(SRC_DIR, "lambda-image-scale"))
+    handler = importlib.import_module("lambda")
+
+    # a missing manifest exercises the handler's s3 path without replicate
+    event = {
+        "Records": [
+            dict(S3_RECORD, s3={**S3_RECORD["s3"], "object": {"key": "missing.json"}})
+        ]
+    }
+    return lambda: handler.lambda_handler(event, None)
+
+
+HELPERS = {
+    "events.s3_event": _events_s3_event,
+    "s3.s3_download": _s3_download,
+    "s3.s3_open": _s3_open,
+    "s3.s3_upload": _s3_upload,
+    "dynamodb.get_item": _dynamodb_get_item,
+    "dynamodb.get_items": _dynamodb_get_items,
+    "dynamodb.query": _dynamodb_query,
+    "dynamodb.put_item": _dynamodb_put_item,
+    "dynamodb.update_item": _dynamodb_update_item,
+    "prompts.get_prompt": _prompts_get_prompt,
+    "prompts.get_prompts": _prompts_get_prompts,
+    "secrets_manager.get_secret": _secrets_manager_get_secret,
+    "lambda_handler": _lambda_handler,
+}
+
+
+def peak_rss_kb():
+    """
+    peak_rss_kb of this process. linux ru_maxrss survives exec, so it would
+    report the parent's peak; VmHWM is reset with the new address space.
+    """
+    try:
+        with open("/proc/self/status", encoding="utf-8") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except FileNotFoundError:
+        pass
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def run_helper(name, calls):
+    """
+    run_helper in this (fresh) interpreter: import, first call, steady calls
+    """
+    start = time.perf_counter()
+    call = HELPERS[name]()
+    imported = time.perf_counter()
+    call()
+    first = time.perf_counter()
+
+    steady = []
+    for _ in range(calls):
+        call_start = time.perf_counter()
+        call()
+        steady.append(time.perf_counter() - call_start)
+
+    return {
+        "helper": name,
+        "import_ms": (imported - start) * 1000,
+        "first_call_ms": (first - imported) * 1000,
+        "steady_ms": statistics.median(steady) * 1000 if steady else None,
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+
+def import_times(module, top=5):
+    """
+    import_times of module in a fresh interpreter with python -X importtime,
+    its cumulative time and the top slowest imports by self time
+    """
+    code = f"import {module}; from bench_layer import peak_rss_kb; print(peak_rss_kb())"
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        check=True,
+        capture_output=True,
+        text=True,
+        env=dict(
+            os.environ,
+            PYTHONPATH=os.pathsep.join([LAMBDA_UTILS_DIR, os.path.dirname(__file__)]),
+        ),
+    )
+
+    entries = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        entries.append((name.strip(), int(self_us), int(cumulative_us)))
+
+    own = [entry for entry in entries if entry[0] == module]
+    slowest = sorted(entries, key=lambda entry: entry[1], reverse=True)[:top]
+    return {
+        "module": module,
+        "cumulative_ms": own[-1][2] / 1000 if own else None,
+        "self_ms": own[-1][1] / 1000 if own else None,
+        "modules_imported": len(entries),
+        "peak_rss_kb": int(out.stdout.strip().splitlines()[-1]),
+        "slowest": [{"module": n, "self_ms": s / 1000} for n, s, _ in slowest],
+    }
+
+
+def seed(endpoint_url):
+    """
+    seed the stand-in with what the helpers read
+    """
+    setup_env(endpoint_url)
+    import boto3  # pylint: disable=import-outside-toplevel
+
+    s3_client = boto3.client("s3")
+    s3_client.create_bucket(
+        Bucket=BUCKET,
+        CreateBucketConfiguration={"LocationConstraint": os.environ["AWS_REGION"]},
+    )
+    s3_client.put_object(Bucket=BUCKET, Key="manifest.json", Body=b'{"job": 1}')
+
+    prompts, lookups = make_prompts(100)
+    create_prompt_tables(prompts, lookups)
+
+    boto3.client("secretsmanager").create_secret(
+        Name=SECRET, SecretString=json.dumps({SECRET: "value"})
+    )
+
+
+def main():
+    """
+    bench lambda-utils layer
+    """
+    parser = ArgumentParser(prog="bench_layer")
+    parser.add_argument("--endpoint-url")
+    parser.add_argument("--helpers", default=",".join(HELPERS))
+    parser.add_argument("--calls", type=int, default=20, help="steady state calls")
+    parser.add_argument("--child", help=SUPPRESS)
+    parser.add_argument("-o", "--output")
+    args = parser.parse_args()
+
+    if args.child:
+        setup_env(args.endpoint_url)
+        logging.disable(logging.CRITICAL)
+        print(json.dumps(run_helper(args.child, args.calls)))
+        return
+
+    setup_env()  # secrets_manager reads AWS_REGION at import
+    modules = sorted(
+        name[:-3] for name in os.listdir(LAMBDA_UTILS_DIR) if name.endswith(".py")
+    )
+    imports = [import_times(module) for module in modules]
+    for entry in imports:
+        print(
+            f"{entry['module']:>20} {entry['cumulative_ms']:>10.1f} ms "
+            f"{entry['peak_rss_kb']:>8} KB"
+        )
+
+    rows = []
+    with local_aws(args.endpoint_url) as endpoint_url:
+        seed(endpoint_url)
+        for name in args.helpers.split(","):
+            out = subprocess.run(
+                [
+                    sys.executable,
+                    os.path.abspath(__file__),
+                    "--child",
+                    name,
+                    "--calls",
+                    str(args.calls),
+                    "--endpoint-url",
+                    endpoint_url,
+                ],
+                capture_output=True,
+                text=True,
+                check=False,
+            )
+            if out.returncode:
+                error = out.stderr.strip().splitlines()[-1:]
+                logger.warning("%s skipped: %s", name, error)
+                rows.append({"helper": name, "skipped": " ".join(error)})
+                continue
+            rows.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    write_results(
+        "layer",
+        [row for row in rows if "skipped" not in row],
+        args.output,
+        imports=imports,
+        skipped=[row for row in rows if "skipped" in row],
+    )
+
+
+if __name__ == "__main__":
+    main()
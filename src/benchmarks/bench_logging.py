@@ -0,0 +1,129 @@
+"""
+Benchmark logging overhead of the dynamodb and prompts helpers: eager
+json_str payloads (the previous behaviour) against lazy json_log, with the
+records filtered out (WARNING) and emitted (INFO). dynamodb is replaced by an
+in-memory fake, so only the helpers' own cost is timed.
+
+    python src/benchmarks/bench_logging.py --calls 2000
+"""
+import logging
+import os
+import timeit
+from argparse import ArgumentParser
+
+from bench_deserialize import make_db_items
+from bench_utils import setup_env, write_results
+
+logger = logging.getLogger(__name__)
+
+
+class FakeDb:
+    """
+    FakeDb canned dynamodb client responses
+    """
+
+    def __init__(self, db_items):
+        self.db_items = db_items
+        self.meta = {"ResponseMetadata": {"HTTPStatusCode": 200, "RetryAttempts": 0}}
+
+    def get_item(self, **_):
+        """
+        get_item
+        """
+        return dict(self.meta, Item=self.db_items[0])
+
+    def batch_get_item(self, RequestItems):  # pylint: disable=invalid-name
+        """
+        batch_get_item
+        """
+        ((table, request),) = RequestItems.items()
+        count = len(request["Keys"])
+        return dict(self.meta, Responses={table: self.db_items[:count]})
+
+    def put_item(self, **_):
+        """
+        put_item
+        """
+        return dict(self.meta)
+
+    def query(self, **_):
+        """
+        query
+        """
+        return dict(self.meta, Items=self.db_items[:20])
+
+
+def helpers(dynamodb, prompts, items):
+    """
+    helpers name => call
+    """
+    ids = [item["id"] for item in items[:50]]
+    expr = {"condition": "task_ = :t", "values": {":t": {"S": "task-0"}}}
+    return {
+        "dynamodb.get_item": lambda: dynamodb.get_item("bench-table", ids[0]),
+        "dynamodb.get_items": lambda: dynamodb.get_items("bench-table", ids),
+        "dynamodb.put_item": lambda: dynamodb.put_item("bench-table", items[0]),
+        "dynamodb.query": lambda: dynamodb.query("bench-table", "index", expr),
+        "prompts.get_prompt": lambda: prompts.get_prompt(ids[0]),
+        "prompts.put_prompt_result": lambda: prompts.put_prompt_result(
+            ids[0], items[0]["template"] * 8
+        ),
+    }
+
+
+def main():
+    """
+    bench logging
+    """
+    parser = ArgumentParser(prog="bench_logging")
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("-o", "--output")
+    args = parser.parse_args()
+
+    setup_env()
+    # pylint: disable=import-outside-toplevel
+    import dynamodb
+    import misc_utils
+    import prompts
+    from item_cache import ItemCache
+
+    ItemCache.disable("prompts-table")
+    db_items = make_db_items(100)
+    items = dynamodb.deserialize_items(db_items)
+    fake = FakeDb(db_items)
+    dynamodb.db = lambda: fake
+
+    with open(os.devnull, "w", encoding="utf8") as devnull:
+        root = logging.getLogger()
+        root.handlers = []
+        root.addHandler(logging.StreamHandler(devnull))
+
+        rows = []
+        for name, call in helpers(dynamodb, prompts, items).items():
+            row = {"helper": name}
+            for mode, json_func in (
+                ("eager", misc_utils.json_str),
+                ("lazy", misc_utils.json_log),
+            ):
+                dynamodb.json_log = prompts.json_log = json_func
+                for level in ("WARNING", "INFO"):
+                    root.setLevel(level)
+                    best = min(
+                        timeit.repeat(call, number=args.calls, repeat=args.repeat)
+                    )
+                    row[f"{mode}_{level.lower()}_us"] = best / args.calls * 1e6
+            row["saved_warning_pct"] = 100 * (
+                1 - row["lazy_warning_us"] / row["eager_warning_us"]
+            )
+            row["saved_info_pct"] = 100 * (
+                1 - row["lazy_info_us"] / row["eager_info_us"]
+            )
+            rows.append(row)
+
+        root.setLevel(logging.WARNING)
+    write_results("logging", rows, args.output)
+
+
+if __name__ == "__main__":
+    main()
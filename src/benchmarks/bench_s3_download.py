@@ -0,0 +1,77 @@
+"""
+Benchmark s3_download throughput versus object size, single stream against
+parallel ranged download.
+
+    python src/benchmarks/bench_s3_download.py --sizes 1,16,64,256
+    python src/benchmarks/bench_s3_download.py --endpoint-url http://localhost:4566
+"""
+import logging
+import os
+import shutil
+import tempfile
+from argparse import ArgumentParser
+
+from bench_utils import local_aws, timed, write_results
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+def main():
+    """
+    bench s3_download
+    """
+    parser = ArgumentParser(prog="bench_s3_download")
+    parser.add_argument("--endpoint-url")
+    parser.add_argument("--bucket", default="bench-s3-download")
+    parser.add_argument("--sizes", default="1,8,32,128", help="object sizes in MB")
+    parser.add_argument("--chunk-size", type=int, default=8, help="MB")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("-o", "--output")
+    args = parser.parse_args()
+
+    with local_aws(args.endpoint_url):
+        import s3  # pylint: disable=import-outside-toplevel
+
+        s3.s3_client().create_bucket(
+            Bucket=args.bucket,
+            CreateBucketConfiguration={"LocationConstraint": os.environ["AWS_REGION"]},
+        )
+        work_dir = tempfile.mkdtemp(prefix="bench_s3_download_")
+
+        rows = []
+        for size_mb in [int(s) for s in args.sizes.split(",")]:
+            key = f"object-{size_mb}mb"
+            s3.s3_client().put_object(
+                Bucket=args.bucket, Key=key, Body=os.urandom(size_mb * MB)
+            )
+            local_path = os.path.join(work_dir, key)
+
+            row = {"size_mb": size_mb}
+            for mode, parallel in (("single", False), ("parallel", True)):
+                elapsed, _ = timed(
+                    s3.s3_download,
+                    args.bucket,
+                    key,
+                    local_path,
+                    force=True,
+                    parallel=parallel,
+                    chunk_size=args.chunk_size * MB,
+                    concurrency=args.concurrency,
+                    threshold=args.chunk_size * MB,
+                    repeat=args.repeat,
+                )
+                row[f"{mode}_sec"] = elapsed
+                row[f"{mode}_mb_sec"] = size_mb / elapsed
+            rows.append(row)
+
+        shutil.rmtree(work_dir)
+
+    write_results("s3_download", rows, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark bulk transfers of many small objects: sequential s3_upload /
+s3_download against s3_upload_many / s3_download_many and a no-op s3_sync.
+
+    python src/benchmarks/bench_s3_many.py --count 2000 --concurrency 4,10
+"""
+import logging
+import os
+import shutil
+import tempfile
+from argparse import ArgumentParser
+
+from bench_utils import local_aws, timed, write_results
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    """
+    bench s3_download_many / s3_upload_many
+    """
+    parser = ArgumentParser(prog="bench_s3_many")
+    parser.add_argument("--endpoint-url")
+    parser.add_argument("--bucket", default="bench-s3-many")
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--size", type=int, default=4096, help="object size bytes")
+    parser.add_argument("--concurrency", default="4,10")
+    parser.add_argument("-o", "--output")
+    args = parser.parse_args()
+
+    with local_aws(args.endpoint_url):
+        import s3  # pylint: disable=import-outside-toplevel
+
+        s3.s3_client().create_bucket(
+            Bucket=args.bucket,
+            CreateBucketConfiguration={"LocationConstraint": os.environ["AWS_REGION"]},
+        )
+        work_dir = tempfile.mkdtemp(prefix="bench_s3_many_")
+        src_dir = os.path.join(work_dir, "src")
+        os.makedirs(src_dir)
+        for i in range(args.count):
+            with open(os.path.join(src_dir, f"obj-{i:06d}"), "wb") as obj_file:
+                obj_file.write(os.urandom(args.size))
+
+        names = sorted(os.listdir(src_dir))
+        rows = []
+
+        def sequential_upload(prefix):
+            for name in names:
+                s3.s3_upload(os.path.join(src_dir, name), args.bucket, prefix + name)
+
+        def sequential_download(prefix, dst_dir):
+            for name in names:
+                s3.s3_download(
+                    args.bucket, prefix + name, os.path.join(dst_dir, name), force=True
+                )
+
+        elapsed, _ = timed(sequential_upload, "seq/")
+        rows.append(_row("upload", "sequential", 1, args.count, elapsed))
+        elapsed, _ = timed(sequential_download, "seq/", os.path.join(work_dir, "seq"))
+        rows.append(_row("download", "sequential", 1, args.count, elapsed))
+
+        for concurrency in [int(c) for c in args.concurrency.split(",")]:
+            url = f"s3://{args.bucket}/many-{concurrency}/"
+            dst_dir = os.path.join(work_dir, f"many-{concurrency}")
+
+            elapsed, _ = timed(
+                s3.s3_upload_many, src_dir, url=url, concurrency=concurrency
+            )
+            rows.append(_row("upload", "many", concurrency, args.count, elapsed))
+            elapsed, _ = timed(
+                s3.s3_download_many, url, local_dir=dst_dir, concurrency=concurrency
+            )
+            rows.append(_row("download", "many", concurrency, args.count, elapsed))
+            elapsed, _ = timed(s3.s3_sync, src_dir, url, concurrency=concurrency)
+            rows.append(_row("upload", "sync-noop", concurrency, args.count, elapsed))
+            elapsed, _ = timed(s3.s3_sync, url, dst_dir, concurrency=concurrency)
+            rows.append(_row("download", "sync-noop", concurrency, args.count, elapsed))
+
+        shutil.rmtree(work_dir)
+
+    write_results("s3_many", rows, args.output)
+
+
+def _row(direction, mode, concurrency, count, elapsed):
+    return {
+        "direction": direction,
+        "mode": mode,
+        "concurrency": concurrency,
+        "objects": count,
+        "sec": elapsed,
+        "objects_sec": count / elapsed,
+    }
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Benchmark stored item size and write capacity of prompt results serialized
+plain against compressed B attributes (zlib, and zstd if installed).
+
+text results are synthetic, from a 30 word vocabulary, and compress far
+better than real llm output. prose results are english text (python stdlib
+docstrings, or --text-file, for example saved llm results) and give
+realistic savings.
+
+    python src/benchmarks/bench_serialize.py --sizes 1,4,16,64,256
+    python src/benchmarks/bench_serialize.py --kinds prose --text-file results.txt
+"""
+import importlib
+import inspect
+import json
+import logging
+import random
+import timeit
+from argparse import ArgumentParser
+from math import ceil
+
+from bench_utils import setup_env, write_results
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+KB = 1024
+WORDS = (
+    "the model image scale prompt result token output manifest job bucket "
+    "upscale quality detail face enhance background color style photo render "
+    "narrator critic poet describe subject actor scene light shadow contrast"
+).split()
+
+
+PROSE_MODULES = (
+    "argparse asyncio collections concurrent.futures csv datetime decimal email "
+    "functools http.client http.server imaplib json logging mailbox os pathlib "
+    "pickle random re shutil smtplib socket sqlite3 ssl string subprocess "
+    "tarfile tempfile threading tkinter turtle typing unittest urllib.request "
+    "xml.dom.minidom zipfile"
+).split()
+
+
+def load_prose(text_file=None):
+    """
+    load_prose text of text_file, else unique stdlib docstrings, in a fixed order
+    """
+    if text_file:
+        with open(text_file, encoding="utf-8") as prose_file:
+            return prose_file.read()
+    docs = []
+    for name in PROSE_MODULES:
+        try:
+            module = importlib.import_module(name)
+        except ImportError:
+            continue
+        for _, obj in inspect.getmembers(module):
+            doc = inspect.getdoc(obj)
+            if doc and len(doc) > 200:
+                docs.append(doc)
+    return "\n\n".join(dict.fromkeys(docs))
+
+
+def make_result(kind, size, rng, prose=""):
+    """
+    make_result synthetic llm text, json manifest like, or prose (a slice of
+    prose at a random offset, repeated if shorter) result of ~size bytes
+    """
+    if kind == "prose":
+        text = prose * ceil(2 * size / len(prose))
+        start = rng.randrange(len(prose))
+        return text[start : start + size]
+
+    if kind == "text":
+        words = []
+        length = 0
+        while length < size:
+            word = rng.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        return " ".join(words)[:size]
+
+    records = []
+    while len(json.dumps(records)) < size:
+        records.append(
+            {
+                "key": f"output/{rng.getrandbits(48):012x}.jpg",
+                "scale": rng.choice([2, 4]),
+                "width": rng.randint(256, 4096),
+                "height": rng.randint(256, 4096),
+                "status": rng.choice(["done", "failed", "pending"]),
+            }
+        )
+    return json.dumps(records)
+
+
+def db_item_size(db_item):
+    """
+    db_item_size approximates dynamodb item size: names plus values
+    """
+    return sum(
+        len(name.encode("utf-8")) + _value_size(v) for name, v in db_item.items()
+    )
+
+
+def _value_size(db_value):
+    ((value_type, value),) = db_value.items()
+    if value_type == "S":
+        return len(value.encode("utf-8"))
+    if value_type == "B":
+        return len(value)
+    if value_type == "N":
+        return ceil(len(value.lstrip("-").replace(".", "")) / 2) + 1
+    return 1
+
+
+def main():
+    """
+    bench serialize
+    """
+    parser = ArgumentParser(prog="bench_serialize")
+    parser.add_argument("--sizes", default="1,4,16,64,256", help="result sizes KB")
+    parser.add_argument("--kinds", default="text,json,prose")
+    parser.add_argument("--text-file", help="prose kind text, default docstrings")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("-o", "--output")
+    args = parser.parse_args()
+
+    setup_env()
+    import dynamodb  # pylint: disable=import-outside-toplevel
+
+    codecs = ["none", "zlib"] + (["zstd"] if dynamodb.zstandard else [])
+    rng = random.Random(42)
+    prose = load_prose(args.text_file) if "prose" in args.kinds else ""
+    rows = []
+    for kind in args.kinds.split(","):
+        for size_kb in [int(s) for s in args.sizes.split(",")]:
+            item = {
+                "id": "res-000001",
+                "prompt_id": "prompt-000001",
+                "result": make_result(kind, size_kb * KB, rng, prose),
+                "created_at": 1700000000,
+                "ttl": 1700604800,
+            }
+            plain_size = None
+            for codec in codecs:
+                dynamodb.DB_COMPRESS_CODEC = codec
+                min_size = 0 if codec == "none" else 1 * KB
+
+                def serialize(min_size=min_size):
+                    return dynamodb.item_to_db_item(item, min_size)
+
+                db_item = serialize()
+                assert dynamodb.deserialize_item(db_item, True) == item
+                size = db_item_size(db_item)
+                plain_size = plain_size or size
+                best = min(timeit.repeat(serialize, number=1, repeat=args.repeat))
+                rows.append(
+                    {
+                        "kind": kind,
+                        "result_kb": size_kb,
+                        "codec": codec,
+                        "item_bytes": size,
+                        "wcu": ceil(size / KB),
+                        "saved_pct": 100 * (1 - size / plain_size),
+                        "serialize_us": best * 1e6,
+                    }
+                )
+
+    write_results("serialize", rows, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark dynamodb stream batch processing with a handler of fixed latency
+(a write per change): one record at a time, as the stream lambdas did, against
+process_stream_batch per key concurrently, uncoalesced and coalesced.
+
+    python src/benchmarks/bench_streams.py --records 100,1000 --keys 10,100
+"""
+import logging
+import threading
+import time
+from argparse import ArgumentParser
+
+from bench_utils import setup_env, write_results
+
+logger = logging.getLogger(__name__)
+
+ARN = "arn:aws:dynamodb:us-west-2:123456789012:table/prompts-table/stream/x"
+
+
+def stream_record(i, keys):
+    """
+    stream_record i of keys items, INSERT of an item's first record, MODIFY
+    of the next ones
+    """
+    image = {"id": {"S": f"prompt-{i % keys:06d}"}, "version": {"N": str(i)}}
+    return {
+        "eventID": f"{i:032x}",
+        "eventName": "MODIFY" if i >= keys else "INSERT",
+        "eventSource": "aws:dynamodb",
+        "dynamodb": {
+            "Keys": {"id": image["id"]},
+            "NewImage": image,
+            "SequenceNumber": f"{i:021d}",
+            "StreamViewType": "NEW_AND_OLD_IMAGES",
+        },
+        "eventSourceARN": ARN,
+    }
+
+
+def main():
+    """
+    bench streams
+    """
+    parser = ArgumentParser(prog="bench_streams")
+    parser.add_argument("--records", default="100,1000")
+    parser.add_argument("--keys", default="10,100")
+    parser.add_argument("--latency-ms", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("-o", "--output")
+    args = parser.parse_args()
+
+    setup_env()
+    import stream_processor  # pylint: disable=import-outside-toplevel
+
+    logging.basicConfig(level=logging.WARNING)
+    latency = args.latency_ms / 1000
+    calls = [0]
+    calls_lock = threading.Lock()
+
+    def handler(unused_change):
+        with calls_lock:
+            calls[0] += 1
+        time.sleep(latency)
+
+    def timed(func):
+        calls[0] = 0
+        started = time.perf_counter()
+        func()
+        return time.perf_counter() - started, calls[0]
+
+    rows = []
+    for count in [int(c) for c in args.records.split(",")]:
+        for keys in [int(k) for k in args.keys.split(",")]:
+            records = [stream_record(i, keys) for i in range(count)]
+            event = {"Records": records}
+
+            per_record, per_record_calls = timed(
+                lambda: [
+                    handler(stream_processor.coalesce_records([r])) for r in records
+                ]
+            )
+            grouped, grouped_calls = timed(
+                lambda: stream_processor.process_stream_batch(
+                    event, handler, coalesce=False, concurrency=args.concurrency
+                )
+            )
+            coalesced, coalesced_calls = timed(
+                lambda: stream_processor.process_stream_batch(
+                    event, handler, concurrency=args.concurrency
+                )
+            )
+            rows.append(
+                {
+                    "records": count,
+                    "keys": keys,
+                    "per_record_s": per_record,
+                    "grouped_s": grouped,
+                    "coalesced_s": coalesced,
+                    "calls": f"{per_record_calls}/{grouped_calls}/{coalesced_calls}",
+                    "speedup": per_record / coalesced,
+                }
+            )
+
+    write_results("streams", rows, args.output)
+
+
+if __name__ == "__main__":
+    main()
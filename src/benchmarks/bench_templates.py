@@ -0,0 +1,105 @@
+"""
+Benchmark prompt template rendering on large templates: naive str.format and
+regex substitution against templates' cached render plans, one at a time and
+batched with render_many.
+
+    python src/benchmarks/bench_templates.py --sizes 4,64,256 --fields 32
+"""
+import logging
+import re
+import timeit
+from argparse import ArgumentParser
+
+from bench_utils import setup_env, write_results
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+KB = 1024
+FIELD_RE = re.compile(r"\{(\w+)\}")
+
+
+def make_template(size, fields):
+    """
+    make_template of ~size bytes, with fields placeholders spread evenly
+    """
+    filler = "Describe the scene in rich, vivid and precise detail. "
+    chunk = filler * max(1, size // fields // len(filler))
+    return "".join(f"{chunk}{{arg{i % fields}}} as {{actor}}. " for i in range(fields))
+
+
+def main():
+    """
+    bench templates
+    """
+    parser = ArgumentParser(prog="bench_templates")
+    parser.add_argument("--sizes", default="4,64,256", help="template sizes KB")
+    parser.add_argument("--fields", type=int, default=32)
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("-o", "--output")
+    args = parser.parse_args()
+
+    setup_env()
+    import templates  # pylint: disable=import-outside-toplevel
+
+    rows = []
+    for size_kb in [int(s) for s in args.sizes.split(",")]:
+        prompt = {
+            "id": f"prompt-{size_kb}",
+            "template": make_template(size_kb * KB, args.fields),
+            "actors": "narrator critic poet",
+        }
+        args_list = [
+            {f"arg{i}": f"value {n}-{i}" for i in range(args.fields)}
+            for n in range(args.batch)
+        ]
+        values_list = [dict(a, actor="narrator") for a in args_list]
+        template = prompt["template"]
+
+        expected = [template.format(**values) for values in values_list]
+        assert templates.render_many(prompt, args_list) == expected
+        assert [
+            FIELD_RE.sub(lambda m, v=values: v[m.group(1)], template)
+            for values in values_list
+        ] == expected
+
+        def best(func, number):
+            return min(timeit.repeat(func, number=number, repeat=args.repeat))
+
+        def naive_format():
+            return [template.format(**values) for values in values_list]
+
+        def naive_regex():
+            return [
+                FIELD_RE.sub(lambda m, v=values: v[m.group(1)], template)
+                for values in values_list
+            ]
+
+        def render_each():
+            return [templates.render_prompt(prompt, a) for a in args_list]
+
+        def render_batch():
+            return templates.render_many(prompt, args_list)
+
+        def compile_cold():
+            templates.clear_template_cache()
+            return templates.compile_template(template, prompt["id"])
+
+        rows.append(
+            {
+                "template_kb": size_kb,
+                "fields": args.fields,
+                "format_us": best(naive_format, 1) / args.batch * 1e6,
+                "regex_us": best(naive_regex, 1) / args.batch * 1e6,
+                "render_us": best(render_each, 1) / args.batch * 1e6,
+                "render_many_us": best(render_batch, 1) / args.batch * 1e6,
+                "compile_us": best(compile_cold, 1) * 1e6,
+            }
+        )
+
+    write_results("templates", rows, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+shared helpers for lambda-utils benchmarks
+
+Benchmarks run offline against local stand-ins for AWS services, by default
+a moto server subprocess (pip install "moto[server]"), or any endpoint
+given with --endpoint-url (localstack, minio, ...).
+"""
+import json
+import logging
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_UTILS_DIR = os.path.join(SRC_DIR, "lambda-utils", "python")
+
+
+def setup_env(endpoint_url=None):
+    """
+    setup_env points boto3 at a local endpoint and puts lambda-utils in path.
+    Must run before lambda-utils modules are imported, since they build their
+    clients from the environment.
+    """
+    os.environ.setdefault("AWS_REGION", "us-west-2")
+    os.environ.setdefault("AWS_DEFAULT_REGION", os.environ["AWS_REGION"])
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    if endpoint_url:
+        os.environ["AWS_ENDPOINT_URL"] = endpoint_url
+
+    if LAMBDA_UTILS_DIR not in sys.path:
+        sys.path.insert(0, LAMBDA_UTILS_DIR)
+
+
+@contextmanager
+def local_aws(endpoint_url=None):
+    """
+    local_aws yields an endpoint url, starting a moto server if none is given
+    """
+    if endpoint_url:
+        setup_env(endpoint_url)
+        yield endpoint_url
+        return
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    # out of process, so the stand-in does not compete for the benchmark's GIL
+    server = subprocess.Popen(
+        [sys.executable, "-m", "moto.server", "-H", "127.0.0.1", "-p", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    endpoint_url = f"http://127.0.0.1:{port}"
+    try:
+        _wait_for_port(port)
+        setup_env(endpoint_url)
+        logger.info("local_aws: moto server at %s", endpoint_url)
+        yield endpoint_url
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def _wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def create_prompt_tables(prompts=None, lookups=None):
+    """
+    create_prompt_tables creates the prompt tables as the lambdas use them,
+    seeded with prompts [{id, template, actors, res_id}] and
+    lookups [{id, task_, type_, via_, prompt_ids}]
+    """
+    import boto3  # pylint: disable=import-outside-toplevel
+
+    db = boto3.client("dynamodb")
+    string_key = {"AttributeName": "id", "AttributeType": "S"}
+    hash_key = {"AttributeName": "id", "KeyType": "HASH"}
+    existing = db.list_tables()["TableNames"]
+
+    for table in ("prompts-table", "prompt-results-table"):
+        if table not in existing:
+            db.create_table(
+                TableName=table,
+                AttributeDefinitions=[string_key],
+                KeySchema=[hash_key],
+                BillingMode="PAY_PER_REQUEST",
+                StreamSpecification={
+                    "StreamEnabled": True,
+                    "StreamViewType": "NEW_AND_OLD_IMAGES",
+                },
+            )
+
+    if "prompt-lookup-table" not in existing:
+        db.create_table(
+            TableName="prompt-lookup-table",
+            AttributeDefinitions=[
+                string_key,
+                {"AttributeName": "task_", "AttributeType": "S"},
+                {"AttributeName": "type_", "AttributeType": "S"},
+            ],
+            KeySchema=[hash_key],
+            GlobalSecondaryIndexes=[
+                {
+                    "IndexName": "task-type",
+                    "KeySchema": [
+                        {"AttributeName": "task_", "KeyType": "HASH"},
+                        {"AttributeName": "type_", "KeyType": "RANGE"},
+                    ],
+                    "Projection": {"ProjectionType": "ALL"},
+                }
+            ],
+            BillingMode="PAY_PER_REQUEST",
+            StreamSpecification={
+                "StreamEnabled": True,
+                "StreamViewType": "NEW_AND_OLD_IMAGES",
+            },
+        )
+
+    for table, items in (("prompts-table", prompts), ("prompt-lookup-table", lookups)):
+        for item in items or []:
+            db.put_item(TableName=table, Item={k: {"S": v} for k, v in item.items()})
+    return db
+
+
+def make_prompts(count, template_size=512):
+    """
+    make_prompts synthetic prompts and their task/type lookups
+    """
+    prompts = []
+    lookups = []
+    for i in range(count):
+        prompt_id = f"prompt-{i:06d}"
+        prompts.append(
+            {
+                "id": prompt_id,
+                "template": f"Describe {{subject}} as {{actor}} #{i} "
+                * (template_size // 32),
+                "actors": "narrator critic poet",
+                "res_id": " ".join(f"res-{i:06d}-{j}" for j in range(3)),
+            }
+        )
+        lookups.append(
+            {
+                "id": f"lookup-{i:06d}",
+                "task_": f"task-{i % 4}",
+                "type_": "text",
+                "via_": "openai",
+                "prompt_ids": prompt_id,
+            }
+        )
+    return prompts, lookups
+
+
+def timed(func, *args, repeat=1, **kwargs):
+    """
+    timed returns (best seconds, last result) over repeat calls of func
+    """
+    best = None
+    res = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, res
+
+
+def write_results(name, rows, out_path=None, **extra):
+    """
+    write_results prints rows as a table and stores them, and any extra
+    sections, as json
+    """
+    if rows:
+        cols = list(rows[0].keys())
+        print(" ".join(f"{c:>14}" for c in cols))
+        for row in rows:
+            print(" ".join(f"{_fmt(row[c]):>14}" for c in cols))
+
+    if not out_path:
+        return None
+
+    results = {
+        "benchmark": name,
+        "created_at": int(time.time()),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "rows": rows,
+        **extra,
+    }
+    with open(out_path, "w", encoding="utf-8") as out_file:
+        json.dump(results, out_file, indent=4)
+    logger.info("write_results: %s", out_path)
+    return out_path
+
+
+def _fmt(value):
+    if isinstance(value, float):
+        return f"{value:.4f}"
+    return str(value)
@@ -6,13 +6,15 @@ import logging
 import os
 import replicate
 
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+
 if logging.getLogger().hasHandlers():
     # The Lambda environment pre-configures a handler logging to stderr.
     # If a handler is already configured,`.basicConfig` does not execute.
     # Thus we set the level directly.
-    logging.getLogger().setLevel(logging.INFO)
+    logging.getLogger().setLevel(LOG_LEVEL)
 else:
-    logging.basicConfig(level=logging.INFO)
+    logging.basicConfig(level=LOG_LEVEL)
 
 logger = logging.getLogger(__name__)
 
@@ -20,9 +22,10 @@ logger = logging.getLogger(__name__)
 # lambda-utils should be in path or included as a lambda layet or
 # as a docker public.ecr.aws/lambda based image in /opt (see Dockerfile).
 #
-from events import s3_event, s3_test_event
-from misc_utils import json_str, zip_path
-from s3 import s3_download, s3_upload
+from batch_handler import is_batch_event, process_batch
+from events import parse_records
+from misc_utils import json_log, zip_path
+from s3 import s3_open, s3_to_url, s3_upload
 from secrets_manager import SecretManager
 
 
@@ -32,14 +35,18 @@ def lambda_handler(event, unused_context):
     """
 
     region = os.environ["AWS_REGION"]
-    logger.info("Region %s Event: %s", region, json_str(event))
+    logger.info("Region %s Event: %s", region, json_log(event))
+
+    # sqs (s3 notifications) batches report their failed messages only
+    if is_batch_event(event):
+        return process_batch(event, process_one_job, types=("s3", "s3-test"))
 
     results = []
     event_records = event["Records"] if event and "Records" in event else []
-    logger.info("event_records : %s", event_records)
+    logger.info("event_records : %s", json_log(event_records))
 
-    for event_record in event_records:
-        job = process_one_event_record(event_record)
+    jobs = parse_records(event_records, types=("s3", "s3-test"))
+    for event_record, job in zip(event_records, jobs):
         logger.info("record job: %s", job)
 
         if job:
@@ -49,23 +56,15 @@ def lambda_handler(event, unused_context):
 
         results.append(res)
 
-    logger.info("lambda_handler results: %s", json_str(results))
+    logger.info("lambda_handler results: %s", json_log(results))
     return results
 
 
-def process_one_event_record(event_record):
-    """
-    process_one_event_record: we are looking for s3 events or test events
-    """
-    job = s3_event(event_record) or s3_test_event(event_record)
-    return job
-
-
 def process_one_job(job):
     """
     process_one_job
     """
-    logger.info("process_one_job job: %s", json_str(job))
+    logger.info("process_one_job job: %s", json_log(job))
     res = None
 
     # download s3 job manifest
@@ -75,18 +74,14 @@ def process_one_job(job):
     if not bucket or not key:
         return {"error": f"missing bucket({bucket}) or key{key}"}
 
-    manifest_path = s3_download(bucket, key)
-    logger.info("manifest_path : %s", manifest_path)
-
-    # parse local manifest:
-    if not manifest_path:
-        return {"error": f"failed to download manifest s3://{bucket}/{key}"}
-
+    # stream manifest straight from s3, no /tmp staging
     manifest = None
     try:
-        with open(manifest_path, "r", encoding="UTF-8") as json_fp:
+        with s3_open(s3_to_url(bucket, key), "r", encoding="UTF-8") as json_fp:
             manifest = json.load(json_fp)
 
+    except FileNotFoundError:
+        return {"error": f"failed to download manifest s3://{bucket}/{key}"}
     except (ValueError, AttributeError, KeyError) as e:
         logger.error(str(e))
 
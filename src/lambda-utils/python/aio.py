@@ -0,0 +1,98 @@
+"""
+asyncio interface for the dynamodb and s3 utils
+
+Each coroutine runs its synchronous helper on a shared, bounded thread pool,
+so handlers can overlap round trips with asyncio.gather:
+
+    prompt, results, manifest = await asyncio.gather(
+        aio.get_item("prompts-table", prompt_id),
+        aio.get_items("prompt-results-table", res_ids),
+        aio.s3_download(bucket, key),
+    )
+
+All threads share the boto3 clients of aws_clients, and so their connection
+pool (AWS_MAX_POOL_CONNECTIONS). The pool is not shared with the helpers'
+own inner pools, so a helper that fans out (get_items, s3_download) can not
+deadlock waiting on its own callers.
+"""
+import asyncio
+import functools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import dynamodb
+import s3
+
+logger = logging.getLogger(__name__)
+
+AIO_CONCURRENCY = int(os.environ.get("AIO_CONCURRENCY", 16))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """
+    _get_pool lazily creates the pool shared by all coroutines
+    """
+    global _pool  # pylint: disable=global-statement
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=AIO_CONCURRENCY, thread_name_prefix="aio"
+            )
+    return _pool
+
+
+async def run(func, *args, **kwargs):
+    """
+    run any synchronous helper on the shared pool, returns its result
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_pool(), functools.partial(func, *args, **kwargs)
+    )
+
+
+async def get_item(table, item_id, cols=None):
+    """
+    async dynamodb.get_item
+    """
+    return await run(dynamodb.get_item, table, item_id, cols)
+
+
+async def get_items(table, ids, key="id", cols=None):
+    """
+    async dynamodb.get_items
+    """
+    return await run(dynamodb.get_items, table, ids, key, cols)
+
+
+async def query(table, index, expr, do_random=False, do_limit=None):
+    """
+    async dynamodb.query
+    """
+    return await run(dynamodb.query, table, index, expr, do_random, do_limit)
+
+
+async def put_item(table, item, compress_min_size=None):
+    """
+    async dynamodb.put_item
+    """
+    return await run(dynamodb.put_item, table, item, compress_min_size)
+
+
+async def s3_download(bucket, key, local_path=None, force=False, **kwargs):
+    """
+    async s3.s3_download
+    """
+    return await run(s3.s3_download, bucket, key, local_path, force, **kwargs)
+
+
+async def s3_upload(local_path, bucket, key=None, force=False, **kwargs):
+    """
+    async s3.s3_upload
+    """
+    return await run(s3.s3_upload, local_path, bucket, key, force, **kwargs)
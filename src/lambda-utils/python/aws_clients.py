@@ -0,0 +1,120 @@
+"""
+lazy, shared boto3 client registry for lambdas
+
+Clients are built on first use, so a handler only pays for the services it
+calls during cold start. boto3 clients are thread safe and shared by all
+threads, sessions and resources are not, so those are kept per thread.
+All clients share one tuned botocore Config, overridable from the lambda
+environment or with configure().
+"""
+import logging
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+logger = logging.getLogger(__name__)
+
+AWS_CLIENT_CONFIG = {
+    "max_pool_connections": int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", 50)),
+    "tcp_keepalive": os.environ.get("AWS_TCP_KEEPALIVE", "true").lower() == "true",
+    "connect_timeout": float(os.environ.get("AWS_CONNECT_TIMEOUT", 5)),
+    "read_timeout": float(os.environ.get("AWS_READ_TIMEOUT", 60)),
+    "retries": {
+        "max_attempts": int(os.environ.get("AWS_MAX_ATTEMPTS", 5)),
+        "mode": os.environ.get("AWS_RETRY_MODE", "standard"),
+    },
+}
+
+_lock = threading.Lock()
+_local = threading.local()
+_session = None
+_clients = {}
+_config = None
+_generation = 0  # bumped by configure, invalidates per thread resources
+
+
+def configure(**overrides):
+    """
+    configure botocore Config options (max_pool_connections, tcp_keepalive,
+    connect_timeout, read_timeout, retries, ...) for clients built from now on.
+    Already built clients are dropped.
+    """
+    global _config, _generation  # pylint: disable=global-statement
+    with _lock:
+        AWS_CLIENT_CONFIG.update(overrides)
+        _config = None
+        _clients.clear()
+        _generation += 1
+    logger.info("aws_clients: configure %s", AWS_CLIENT_CONFIG)
+
+
+def client_config():
+    """
+    client_config shared botocore Config
+    """
+    global _config  # pylint: disable=global-statement
+    if _config is None:
+        _config = Config(**AWS_CLIENT_CONFIG)
+    return _config
+
+
+def get_session():
+    """
+    get_session boto3 session of the calling thread
+    """
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = boto3.session.Session()
+    return session
+
+
+def get_client(service, region_name=None, endpoint_url=None):
+    """
+    get_client shared boto3 client, built on first use
+    """
+    cache_key = (service, region_name, endpoint_url)
+    client = _clients.get(cache_key)
+    if client is not None:
+        return client
+
+    global _session  # pylint: disable=global-statement
+    with _lock:
+        client = _clients.get(cache_key)
+        if client is None:
+            # building clients from one session is not thread safe, hence the lock
+            if _session is None:
+                _session = boto3.session.Session()
+            client = _session.client(
+                service,
+                region_name=region_name,
+                endpoint_url=endpoint_url,
+                config=client_config(),
+            )
+            _clients[cache_key] = client
+            logger.debug("aws_clients: new %s client", service)
+    return client
+
+
+def get_resource(service, region_name=None, endpoint_url=None):
+    """
+    get_resource boto3 resource of the calling thread, built on first use
+    """
+    if getattr(_local, "generation", None) != _generation:
+        _local.resources = {}
+        _local.generation = _generation
+    resources = _local.resources
+
+    cache_key = (service, region_name, endpoint_url)
+    resource = resources.get(cache_key)
+    if resource is None:
+        resource = get_session().resource(
+            service,
+            region_name=region_name,
+            endpoint_url=endpoint_url,
+            config=client_config(),
+        )
+        resources[cache_key] = resource
+        logger.debug("aws_clients: new %s resource", service)
+    return resource
@@ -0,0 +1,168 @@
+"""
+partial batch failure reporting for sqs and stream event sources
+
+With ReportBatchItemFailures on the event source mapping, a handler returns
+the records it failed, and only those are retried (sqs) or the shard resumes
+from the first of them (dynamodb / kinesis streams), instead of the whole
+batch. process_batch runs each record independently:
+
+    lambda_handler = batch_handler(process_one_job, types=("s3", "s3-test"))
+
+sqs messages holding s3 notifications are expanded into their s3 jobs, the
+message fails if any of them fails. A job fails if process_job raises or
+returns a dict with an "error".
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from events import is_sqs_record, parse_records
+from misc_utils import json_log
+
+logger = logging.getLogger(__name__)
+
+# records processed at once for unordered (sqs standard queue) batches
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", 1))
+
+BATCH_EVENT_SOURCES = ("aws:sqs", "aws:dynamodb", "aws:kinesis")
+
+
+def is_batch_event(event):
+    """
+    is_batch_event True for events of sqs or stream event source mappings
+    """
+    records = (event or {}).get("Records") or []
+    return bool(records) and all(
+        isinstance(record, dict) and record.get("eventSource") in BATCH_EVENT_SOURCES
+        for record in records
+    )
+
+
+def batch_item_id(record):
+    """
+    batch_item_id itemIdentifier of a record: sqs messageId, or stream
+    sequence number, None for other records
+    """
+    if not isinstance(record, dict):
+        return None
+    if is_sqs_record(record):
+        return record.get("messageId")
+    if record.get("eventSource") == "aws:dynamodb":
+        return record.get("dynamodb", {}).get("SequenceNumber")
+    if record.get("eventSource") == "aws:kinesis":
+        return record.get("kinesis", {}).get("sequenceNumber")
+    return None
+
+
+def is_ordered(record):
+    """
+    is_ordered True for records of fifo queues and streams, whose later
+    records must not be processed past a failure
+    """
+    if is_sqs_record(record):
+        return (record.get("eventSourceARN") or "").endswith(".fifo")
+    return batch_item_id(record) is not None
+
+
+def process_batch(event, process_job, types=None, concurrency=None):
+    """
+    process_batch runs process_job on the job of each record of event and
+    returns the failed ones as {"batchItemFailures": [{"itemIdentifier": id}]}.
+    types limits the job types (see parse_records), sqs messages are always
+    parsed and their plain (not s3) jobs processed only if "sqs" in types.
+    Ordered batches stop at the first failure and report the rest as failed.
+    """
+    records = (event or {}).get("Records") or []
+    parse_types = None if types is None else tuple(types) + ("sqs",)
+    jobs = parse_records(records, types=parse_types)
+    concurrency = concurrency or BATCH_CONCURRENCY
+
+    def run(job):
+        return _process_record_job(job, process_job, types)
+
+    ordered = any(is_ordered(record) for record in records)
+    if ordered or concurrency <= 1 or len(jobs) <= 1:
+        succeeded = []
+        for job in jobs:
+            if ordered and not all(succeeded):  # skipped past a failure
+                succeeded.append(False)
+            else:
+                succeeded.append(run(job))
+    else:
+        with ThreadPoolExecutor(concurrency, thread_name_prefix="batch") as pool:
+            succeeded = list(pool.map(run, jobs))
+
+    response = batch_item_failures(records, succeeded)
+    logger.info(
+        "process_batch: %d of %d records failed%s",
+        len(response["batchItemFailures"]),
+        len(records),
+        " (ordered)" if ordered else "",
+    )
+    return response
+
+
+def batch_item_failures(records, succeeded):
+    """
+    batch_item_failures response reporting records whose succeeded flag is
+    False, {"batchItemFailures": [{"itemIdentifier": id}]}
+    """
+    failures = []
+    for record, ok in zip(records, succeeded):
+        if ok:
+            continue
+        item_id = batch_item_id(record)
+        if item_id is None:
+            logger.error("process_batch: failed record has no id: %s", json_log(record))
+        else:
+            failures.append({"itemIdentifier": item_id})
+    return {"batchItemFailures": failures}
+
+
+def run_job(process_job, job):
+    """
+    run_job True if process_job(job) neither raises nor returns a dict with
+    an "error"
+    """
+    try:
+        res = process_job(job)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception("process_batch: job failed: %s", json_log(job))
+        return False
+    if isinstance(res, dict) and res.get("error"):
+        logger.error("process_batch: job failed: %s", res["error"])
+        return False
+    return True
+
+
+def _process_record_job(job, process_job, types):
+    """
+    _process_record_job True if the job of a record, or all the s3 jobs of
+    an sqs message, succeeded
+    """
+    if not job:
+        logger.error("process_batch: record has no job")
+        return False
+    if job.get("eventType") == "sqs" and "jobs" in job:
+        record_jobs = job["jobs"]
+    elif job.get("eventType") == "sqs" and types is not None and "sqs" not in types:
+        logger.error("process_batch: sqs message %s has no job", job["messageId"])
+        return False
+    else:
+        record_jobs = [job]
+
+    for record_job in record_jobs:
+        if not record_job or not run_job(process_job, record_job):
+            return False
+    return True
+
+
+def batch_handler(process_job, types=None, concurrency=None):
+    """
+    batch_handler lambda handler of process_batch with process_job
+    """
+
+    def handler(event, unused_context=None):
+        return process_batch(event, process_job, types, concurrency)
+
+    return handler
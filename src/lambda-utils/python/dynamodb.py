@@ -1,21 +1,132 @@
 """
 boto3 dynamodb utils for lambdas
 """
+import decimal
 import logging
+import os
 import random
-
-import boto3
-from boto3.dynamodb.types import TypeDeserializer
-from misc_utils import json_str
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import expressions
+from aws_clients import get_client
+from boto3.dynamodb.types import DYNAMODB_CONTEXT, Binary, TypeDeserializer
+from botocore.exceptions import ClientError
+from item_cache import ItemCache
+from misc_utils import json_log, reservoir_sample
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, zlib is always available
+    zstandard = None
 
 logging.getLogger("boto3").setLevel(logging.WARNING)
 logging.getLogger("botocore").setLevel(logging.WARNING)
 
 logger = logging.getLogger(__name__)
 
-db = boto3.client("dynamodb")
 db_deserializer = TypeDeserializer()
 
+#
+# batch requests: dynamodb takes up to 100 keys per batch_get_item and 25
+# requests per batch_write_item. batch_get_item chunks are sent concurrently
+# on a shared pool, unprocessed (throttled) keys and items are retried with
+# full jitter exponential backoff.
+#
+DB_BATCH_GET_SIZE = 100
+DB_BATCH_WRITE_SIZE = 25
+DB_CONCURRENCY = int(os.environ.get("DB_CONCURRENCY", 8))
+DB_MAX_RETRIES = int(os.environ.get("DB_MAX_RETRIES", 8))
+DB_BACKOFF_BASE = float(os.environ.get("DB_BACKOFF_BASE", 0.05))
+DB_BACKOFF_CAP = float(os.environ.get("DB_BACKOFF_CAP", 5))
+_pool = None
+_pool_lock = threading.Lock()
+
+# deserialize numbers as int / float instead of Decimal, when lossless
+DB_NATIVE_NUMBERS = os.environ.get("DB_NATIVE_NUMBERS", "false").lower() == "true"
+
+#
+# opt-in compression: str / bytes values of DB_COMPRESS_MIN_SIZE bytes or more
+# (0 is off) are written as compressed B values and decompressed on read.
+# Table and index key attributes are never compressed, nor are
+# DB_COMPRESS_EXCLUDE attributes (comma separated, used in conditions / filters)
+#
+DB_COMPRESS_MIN_SIZE = int(os.environ.get("DB_COMPRESS_MIN_SIZE", 0))
+DB_COMPRESS_CODEC = os.environ.get("DB_COMPRESS_CODEC", "zlib")  # zlib or zstd
+DB_COMPRESS_LEVEL = int(os.environ.get("DB_COMPRESS_LEVEL", 6))
+DB_COMPRESS_MAGIC = b"\x00dbz"
+DB_KEY_ATTRIBUTES = ("id",)
+DB_COMPRESS_EXCLUDE = tuple(
+    filter(None, os.environ.get("DB_COMPRESS_EXCLUDE", "").split(","))
+)
+_key_attributes = {}  # table => frozenset of table and index key attributes
+
+
+def db():
+    """
+    db shared dynamodb client, built on first use
+    """
+    return get_client("dynamodb")
+
+
+def deserialize_items(db_items, native_numbers=None):
+    """
+    deserialize_items converts a list of db items in one pass
+    """
+    if native_numbers is None:
+        native_numbers = DB_NATIVE_NUMBERS
+    number = _native_number if native_numbers else DYNAMODB_CONTEXT.create_decimal
+    return [
+        {k: _deserialize(v, number) for k, v in db_item.items()} for db_item in db_items
+    ]
+
+
+def deserialize_item(db_item, native_numbers=None):
+    """
+    deserialize_item converts db item {name: {type: value}} to python dict
+    """
+    return deserialize_items([db_item], native_numbers)[0]
+
+
+def _deserialize(db_value, number):
+    """
+    _deserialize fast path for S/N/BOOL/M/L/NULL/B, TypeDeserializer for sets
+    """
+    for type_, value in db_value.items():
+        if type_ == "S":
+            return value
+        if type_ == "N":
+            return number(value)
+        if type_ == "M":
+            return {k: _deserialize(v, number) for k, v in value.items()}
+        if type_ == "L":
+            return [_deserialize(v, number) for v in value]
+        if type_ == "BOOL":
+            return value
+        if type_ == "NULL":
+            return None
+        if type_ == "B":
+            return decompress_value(value)
+        break
+    return db_deserializer.deserialize(db_value)  # SS, NS, BS
+
+
+def _native_number(value):
+    """
+    _native_number int, or float if it prints back the same, else Decimal
+    """
+    if "." not in value and "e" not in value and "E" not in value:
+        return int(value)
+    as_float = float(value)
+    if repr(as_float) == value:  # common case, no Decimal needed
+        return as_float
+    as_decimal = DYNAMODB_CONTEXT.create_decimal(value)
+    if DYNAMODB_CONTEXT.create_decimal(repr(as_float)) == as_decimal:
+        return as_float
+    return as_decimal
+
 
 def get_item(table, item_id, cols=None):
     """
@@ -26,25 +137,30 @@ def get_item(table, item_id, cols=None):
 
     if not item_id:
         return None
+
+    item = ItemCache.get(table, item_id, cols)
+    if item is not None:
+        logger.info("get_item cached: %s", json_log(item))
+        return item
+
+    request = {"TableName": table, "Key": {"id": {"S": item_id}}}
     if cols:
-        res = db.get_item(
-            TableName=table, Key={"id": {"S": item_id}}, ProjectionExpression=cols
-        )
-    else:
-        res = db.get_item(TableName=table, Key={"id": {"S": item_id}})
-    logger.info("get_item: %s", json_str(res))
+        request.update(projection_request(cols))
+    res = db().get_item(**request)
+    logger.debug("get_item: %s", json_log(res))
 
     # unpack response
     try:
         db_item = res["Item"]
         if not db_item:
             return None
-        item = {k: db_deserializer.deserialize(v) for k, v in db_item.items()}
+        item = deserialize_item(db_item)
     except KeyError:
         logger.error("could not find item (id:%s) in %s", item_id, table)
         item = None
 
-    logger.info("get_item returned: %s", json_str(item))
+    ItemCache.put(table, item_id, item, cols)
+    logger.info("get_item returned: %s", json_log(item))
     return item
 
 
@@ -53,71 +169,136 @@ def dump_db_items(db_items):
     dump_db_items
     """
     for i in db_items:
-        logger.info("list item: %s", json_str(i))
+        logger.info("list item: %s", json_log(i))
         for k, value in i.items():
             logger.info(
                 "item key:%s value:%s ",
-                json_str(k),
-                json_str(value),
+                json_log(k),
+                json_log(value),
             )
 
 
 def get_items(table, ids, key="id", cols=None):
     """
-    get_items
+    get_items batch gets ids (deduplicated) in chunks of 100 keys issued
+    concurrently, retrying throttled unprocessed keys with jittered backoff.
+    Returns a list with the item of each input id, in input order, None for
+    ids not found (so results line up with ids, [] for no ids)
     """
 
     if not ids:
-        return None
-    one_only = len(ids) == 1
-    if one_only:
-        items = [get_item(table, ids[0], cols)]
-        logger.debug("get_items returned: %s", json_str(items))
+        return []
+    input_ids = list(ids)
+    ids = list(dict.fromkeys(input_ids))  # dedup, keep input order
+    if len(ids) == 1 and key == "id":
+        items = [get_item(table, ids[0], cols)] * len(input_ids)
+        logger.debug("get_items returned: %s", json_log(items))
         return items
 
-    keys = [{key: {"S": v}} for v in ids]
-    logger.debug("get_items keys: %s", json_str(keys))
-
+    cached = {}
+    if key == "id" and ItemCache.enabled(table):
+        for item_id in ids:
+            item = ItemCache.get(table, item_id, cols)
+            if item is not None:
+                cached[item_id] = item
+        if len(cached) == len(ids):
+            items = [cached[item_id] for item_id in input_ids]
+            logger.debug("get_items cached: %s", json_log(items))
+            return items
+
+    request = {"ConsistentRead": True}
+    cache_cols = cols
     if cols:
-        res = db.batch_get_item(
-            RequestItems={
-                table: {
-                    "Keys": keys,
-                    "ConsistentRead": True,
-                    "ProjectionExpression": cols,
-                }
-            }
-        )
+        # results are matched back to ids by key, so it must be projected
+        names = expressions.cols_to_names(cols)
+        if key not in names:
+            names += (key,)
+        request.update(projection_request(names))
+
+    missing = [item_id for item_id in ids if item_id not in cached]
+    chunks = [
+        missing[start : start + DB_BATCH_GET_SIZE]
+        for start in range(0, len(missing), DB_BATCH_GET_SIZE)
+    ]
+    logger.debug("get_items: %d ids in %d chunks", len(ids), len(chunks))
+
+    if len(chunks) == 1:
+        db_items = _batch_get_chunk(table, key, chunks[0], request)
     else:
-        res = db.batch_get_item(
-            RequestItems={
-                table: {
-                    "Keys": keys,
-                    "ConsistentRead": True,
-                }
-            }
+        futures = [
+            _get_pool().submit(_batch_get_chunk, table, key, chunk, request)
+            for chunk in chunks
+        ]
+        db_items = [db_item for future in futures for db_item in future.result()]
+
+    # dump_db_items(db_items)
+
+    found = {item[key]: item for item in deserialize_items(db_items)}
+    if key == "id":
+        for item_id, item in found.items():
+            ItemCache.put(table, item_id, item, cache_cols)
+    found.update(cached)
+    if len(found) < len(ids):
+        logger.error(
+            "could not find items for ids: %s",
+            json_log([item_id for item_id in ids if item_id not in found]),
         )
-    logger.debug("batch_get_item: %s", json_str(res))
+    items = [found.get(item_id) for item_id in input_ids]
 
-    # unpack response
+    logger.debug("get_items returned: %s", json_log(items))
+    return items
 
-    try:
-        db_items = res["Responses"][table]
-        if not db_items:
-            return None
 
-        # dump_db_items(db_items)
+def _batch_get_chunk(table, key, chunk, request):
+    """
+    _batch_get_chunk batch_get_item of up to 100 ids, until no unprocessed keys
+    """
+    request_items = {table: dict(request, Keys=[{key: {"S": v}} for v in chunk])}
+    db_items = []
+
+    for attempt in range(DB_MAX_RETRIES + 1):
+        if attempt:
+            backoff(attempt)
+        res = db().batch_get_item(RequestItems=request_items)
+        db_items.extend(res.get("Responses", {}).get(table, []))
+
+        request_items = res.get("UnprocessedKeys")
+        if not request_items:
+            return db_items
+        logger.warning(
+            "batch_get_item: %d unprocessed keys, retry %d",
+            len(request_items[table]["Keys"]),
+            attempt + 1,
+        )
 
-        items = [
-            {u: db_deserializer.deserialize(w) for u, w in v.items()} for v in db_items
-        ]
+    raise RuntimeError(
+        f"batch_get_item: {len(request_items[table]['Keys'])} keys of {table} "
+        f"unprocessed after {DB_MAX_RETRIES} retries"
+    )
 
-    except KeyError:
-        logger.error("could not find prompts for keys: %s", json_str(keys))
-        items = None
 
-    logger.debug("get_items returned: %s", json_str(items))
-    return items
+def backoff(attempt, base=None, cap=None):
+    """
+    backoff sleeps for a full jitter exponential delay before retry attempt
+    """
+    base = base or DB_BACKOFF_BASE
+    cap = cap or DB_BACKOFF_CAP
+    delay = random.uniform(0, min(cap, base * 2**attempt))
+    time.sleep(delay)
+    return delay
+
+
+def _get_pool():
+    """
+    _get_pool lazily creates the request pool shared by all calls
+    """
+    global _pool  # pylint: disable=global-statement
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=DB_CONCURRENCY, thread_name_prefix="dynamodb"
+            )
+    return _pool
 
 
 def query(
@@ -128,136 +309,692 @@ def query(
     do_limit=None,
 ):
     """
-    query
+    query all result pages; do_random with do_limit picks do_limit items
+    uniformly over all pages by reservoir sampling, keeping only do_limit
+    items in memory. Without do_random, pages stop once do_limit is reached.
     """
 
-    # unpack the many arguments for dynamodb query
-    expr_cond = expr["condition"]
-    expr_filter = expr["filter"] if "filter" in expr else None
-    expr_values = expr["values"]
-    expr_cols = expr["cols"] if "cols" in expr else ""
-
-    if expr_filter:
-        res = db.query(
-            TableName=table,
-            IndexName=index,
-            KeyConditionExpression=expr_cond,
-            FilterExpression=expr_filter,
-            ExpressionAttributeValues=expr_values,
-            ProjectionExpression=expr_cols,
-        )
-    else:  # <-- no filter: FilterExpression can't be None
-        res = db.query(
-            TableName=table,
-            IndexName=index,
-            KeyConditionExpression=expr_cond,
-            ExpressionAttributeValues=expr_values,
-            ProjectionExpression=expr_cols,
-        )
+    if do_random and do_limit:
+        db_items = reservoir_sample(query_pages(table, index, expr), do_limit)
+        random.shuffle(db_items)  # reservoir order is biased to early pages
+    elif do_random:
+        db_items = list(query_pages(table, index, expr))
+        random.shuffle(db_items)
+    else:
+        db_items = list(query_pages(table, index, expr, limit=do_limit))
 
     # Traslate db low level representation to `normal` python list
-    db_items = res["Items"] if "Items" in res else None
-    logger.debug("query db_items : %s", json_str(db_items))
+    logger.debug("query db_items : %s", json_log(db_items))
     if not db_items:
         return None
 
     # dump_db_items(db_items)
 
-    items = [
-        {k: db_deserializer.deserialize(v) for k, v in i.items()} for i in db_items
-    ]
-    logger.debug("items : %s", json_str(items))
+    items = deserialize_items(db_items)
 
-    one_only = len(items) == 1  # check again if we have only one
+    logger.debug("query returned: %s", json_log(items))
+    return items
 
-    # shuffle only if we have more than one
-    if do_random and not one_only:
-        random.shuffle(items)
-    if do_limit:
-        items = items[:do_limit]
 
-    logger.debug("query returned: %s", json_str(items))
-    return items
+def query_iter(table, index, expr, limit=None, page_size=None):
+    """
+    query_iter lazily yields deserialized query items across pages
+    """
+    for db_item in query_pages(table, index, expr, limit, page_size):
+        yield deserialize_item(db_item)
+
+
+def scan_iter(table, cols=None, page_size=None, **kwargs):
+    """
+    scan_iter lazily yields all deserialized items of table, see scan_pages
+    """
+    for db_item in scan_pages(table, cols, page_size=page_size, **kwargs):
+        yield deserialize_item(db_item)
+
+
+def scan_pages(
+    table,
+    cols=None,
+    filter_=None,
+    names=None,
+    values=None,
+    segment=None,
+    total_segments=None,
+    page_size=None,
+    budget=None,
+):
+    """
+    scan_pages lazily yields raw db items of table (or of segment of
+    total_segments), following LastEvaluatedKey. filter_ is a FilterExpression
+    over names placeholders and python values. budget (CapacityBudget) paces
+    pages by their consumed read capacity.
+    """
+    kwargs = {"TableName": table}
+    if cols:
+        kwargs.update(projection_request(cols))
+    if filter_:
+        kwargs["FilterExpression"] = filter_
+        if names:
+            kwargs.setdefault("ExpressionAttributeNames", {}).update(names)
+        if values:
+            kwargs["ExpressionAttributeValues"] = {
+                k: value_to_db_value(v, 0) for k, v in values.items()
+            }
+    if total_segments:
+        kwargs.update(Segment=segment, TotalSegments=total_segments)
+    if page_size:
+        kwargs["Limit"] = page_size
+    if budget:
+        kwargs["ReturnConsumedCapacity"] = "TOTAL"
+
+    while True:
+        res = db().scan(**kwargs)
+        if budget:
+            budget.consume(consumed_capacity(res))
+        yield from res.get("Items", [])
+        if "LastEvaluatedKey" not in res:
+            return
+        kwargs["ExclusiveStartKey"] = res["LastEvaluatedKey"]
+
+
+def consumed_capacity(res):
+    """
+    consumed_capacity units of a response with ReturnConsumedCapacity TOTAL
+    """
+    consumed = res.get("ConsumedCapacity") or []
+    if isinstance(consumed, dict):
+        consumed = [consumed]
+    return sum(c.get("CapacityUnits", 0) for c in consumed)
 
 
-def value_to_db_value(value):
+class CapacityBudget:
     """
-    value_to_db_value constructs dynammodb value object
+    CapacityBudget paces requests of any number of threads to rate consumed
+    capacity units per second, with bursts of up to burst units: consume()
+    reports the units of a completed request and sleeps while overdrawn.
     """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.consumed = 0
+        self.waited = 0
+        self._balance = self.burst
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, units):
+        """
+        consume units, returns the seconds slept
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._balance = min(
+                self.burst, self._balance + (now - self._updated_at) * self.rate
+            )
+            self._updated_at = now
+            self._balance -= units
+            self.consumed += units
+            delay = -self._balance / self.rate if self._balance < 0 else 0
+            self.waited += delay
+        if delay:
+            time.sleep(delay)
+        return delay
+
+
+def query_pages(table, index, expr, limit=None, page_size=None):
+    """
+    query_pages lazily yields raw db items, following LastEvaluatedKey.
+    limit stops after limit items, and is pushed down as the page Limit
+    when there is no filter (dynamodb applies Limit before filtering).
+    """
+
+    # unpack the many arguments for dynamodb query
+    expr_cond = expr["condition"]
+    expr_filter = expr["filter"] if "filter" in expr else None
+    expr_values = expr["values"]
+    expr_cols = expr["cols"] if "cols" in expr else None
+
+    kwargs = {
+        "TableName": table,
+        "IndexName": index,
+        "KeyConditionExpression": expr_cond,
+        "ExpressionAttributeValues": expr_values,
+    }
+    if expr_filter:  # <-- FilterExpression can't be None
+        kwargs["FilterExpression"] = expr_filter
+    if expr.get("names"):
+        kwargs["ExpressionAttributeNames"] = dict(expr["names"])
+    if expr_cols:
+        projection = projection_request(expr_cols)
+        kwargs["ProjectionExpression"] = projection["ProjectionExpression"]
+        kwargs.setdefault("ExpressionAttributeNames", {}).update(
+            projection["ExpressionAttributeNames"]
+        )
+
+    remaining = limit
+    while True:
+        page_limit = page_size
+        if remaining and not expr_filter:
+            page_limit = min(remaining, page_size) if page_size else remaining
+        if page_limit:
+            kwargs["Limit"] = page_limit
+
+        res = db().query(**kwargs)
+        db_items = res.get("Items", [])
+        logger.debug("query page: %d items", len(db_items))
+
+        for db_item in db_items:
+            yield db_item
+            if remaining:
+                remaining -= 1
+                if not remaining:
+                    return
+
+        if "LastEvaluatedKey" not in res:
+            return
+        kwargs["ExclusiveStartKey"] = res["LastEvaluatedKey"]
+
+
+def value_to_db_value(value, compress_min_size=None):
+    """
+    value_to_db_value constructs dynammodb value object, for None, bool, str,
+    int / float / Decimal, bytes, list / tuple, dict and sets.
+    str / bytes values of compress_min_size bytes or more are stored as
+    compressed B values, when that makes them smaller.
+    """
+    if compress_min_size is None:
+        compress_min_size = DB_COMPRESS_MIN_SIZE
     value_type = value_to_db_type(value)
-    db_value = None
 
-    if value_type == "S":
-        db_value = {"S": value}
+    if value_type in ("S", "B"):
+        size = _byte_size(value, compress_min_size) if compress_min_size else 0
+        if compress_min_size and size >= compress_min_size:
+            compressed = compress_value(value)
+            if compressed is not None:
+                return {"B": compressed}
+        db_value = {value_type: bytes(value) if value_type == "B" else value}
     elif value_type == "N":
-        db_value = {"N": str(value)}
+        db_value = {"N": number_to_db_number(value)}
+    elif value_type == "BOOL":
+        db_value = {"BOOL": value}
+    elif value_type == "NULL":
+        db_value = {"NULL": True}
+    elif value_type == "L":
+        db_value = {"L": [value_to_db_value(v, compress_min_size) for v in value]}
+    elif value_type == "M":
+        db_value = {
+            "M": {
+                str(k): value_to_db_value(v, compress_min_size)
+                for k, v in value.items()
+            }
+        }
+    elif value_type == "SS":
+        db_value = {"SS": sorted(value)}
+    elif value_type == "NS":
+        db_value = {"NS": sorted(number_to_db_number(v) for v in value)}
+    elif value_type == "BS":
+        db_value = {"BS": sorted(bytes(v) for v in value)}
+    else:
+        raise TypeError(f"unsupported dynamodb value type {type(value).__name__}")
 
-    logger.debug("value %s into db_value %s", str(value), json_str(db_value))
     return db_value
 
 
+def _byte_size(value, limit):
+    """
+    _byte_size of str (utf-8) or bytes value, exact only below limit: str of
+    limit chars or more are at least limit bytes, encoded only when shorter
+    """
+    if isinstance(value, str) and len(value) < limit:
+        return len(value.encode("utf-8"))
+    return len(value)
+
+
 def value_to_db_type(var):
     """
     value_to_db_type detects type of variable as dynammodb type
     """
+    if var is None:
+        return "NULL"
+    if isinstance(var, bool):  # before int, bool is an int
+        return "BOOL"
     if isinstance(var, str):
         return "S"
-    if isinstance(var, int):
+    if isinstance(var, (int, float, decimal.Decimal)):
         return "N"
+    if isinstance(var, (bytes, bytearray, Binary)):
+        return "B"
+    if isinstance(var, (list, tuple)):
+        return "L"
+    if isinstance(var, dict):
+        return "M"
+    if isinstance(var, (set, frozenset)):
+        if not var:
+            raise ValueError("dynamodb sets can not be empty")
+        kinds = {value_to_db_type(v) for v in var}
+        if kinds == {"S"}:
+            return "SS"
+        if kinds == {"N"}:
+            return "NS"
+        if kinds == {"B"}:
+            return "BS"
+        raise TypeError(f"dynamodb sets must have one of S, N, B types: {kinds}")
 
     return None
 
 
-def put_item(table, item):
+def number_to_db_number(value):
+    """
+    number_to_db_number string for dynamodb N, floats go through their repr
+    """
+    if isinstance(value, float):
+        value = DYNAMODB_CONTEXT.create_decimal(repr(value))
+    if isinstance(value, decimal.Decimal) and not value.is_finite():
+        raise ValueError(f"dynamodb numbers must be finite: {value}")
+    return str(value)
+
+
+def compress_value(value, codec=None):
+    """
+    compress_value str or bytes into a self describing B value:
+        DB_COMPRESS_MAGIC + codec (z zlib, s zstd) + type (S, B) + payload
+    Returns None if compression does not save space.
+    """
+    codec = codec or DB_COMPRESS_CODEC
+    value_type = b"S" if isinstance(value, str) else b"B"
+    data = value.encode("utf-8") if isinstance(value, str) else bytes(value)
+
+    if codec == "zstd":
+        if zstandard is None:
+            raise ImportError("zstd compression requires the zstandard package")
+        payload = zstandard.ZstdCompressor(level=DB_COMPRESS_LEVEL).compress(data)
+        codec_id = b"s"
+    else:
+        payload = zlib.compress(data, DB_COMPRESS_LEVEL)
+        codec_id = b"z"
+
+    compressed = DB_COMPRESS_MAGIC + codec_id + value_type + payload
+    if len(compressed) >= len(data):
+        return None
+    return compressed
+
+
+def decompress_value(data):
+    """
+    decompress_value of compress_value output back to str or bytes,
+    other binary values are returned as Binary
+    """
+    data = bytes(data)
+    if not data.startswith(DB_COMPRESS_MAGIC):
+        return Binary(data)
+
+    header = len(DB_COMPRESS_MAGIC)
+    codec_id, value_type = data[header : header + 1], data[header + 1 : header + 2]
+    payload = data[header + 2 :]
+    if codec_id == b"s":
+        if zstandard is None:
+            raise ImportError("zstd decompression requires the zstandard package")
+        value = zstandard.ZstdDecompressor().decompress(payload)
+    else:
+        value = zlib.decompress(payload)
+
+    return value.decode("utf-8") if value_type == b"S" else value
+
+
+def put_item(table, item, compress_min_size=None):
     """
-    put_item
+    put_item, compress_min_size overrides DB_COMPRESS_MIN_SIZE
     """
     # for k, val in item.items():
     #    logger.info("put_item item key: %s -> value:%s", k, str(val))
 
-    db_item = {k: value_to_db_value(v) for k, v in item.items()}
-    res = db.put_item(TableName=table, Item=db_item)
-    logger.info("put_item res: %s", json_str(res))
+    db_item = item_to_db_item(item, compress_min_size, table)
+    res = db().put_item(TableName=table, Item=db_item)
+    ItemCache.invalidate(table, item.get("id"))
+    logger.debug("put_item res: %s", json_log(res))
     return res
 
 
-def update_item(table, key, item):
+def item_to_db_item(item, compress_min_size=None, table=None):
+    """
+    item_to_db_item serializes python item, key attributes (of table and its
+    indexes, see key_attributes) and DB_COMPRESS_EXCLUDE are never compressed
+    """
+    if compress_min_size is None:
+        compress_min_size = DB_COMPRESS_MIN_SIZE
+    exempt = frozenset(DB_KEY_ATTRIBUTES)
+    if compress_min_size and table:
+        exempt = key_attributes(table)
+    if not compress_min_size or exempt is None:  # unknown keys are not compressed
+        return {k: value_to_db_value(v, 0) for k, v in item.items()}
+
+    exempt = exempt.union(DB_COMPRESS_EXCLUDE)
+    return {
+        k: value_to_db_value(v, 0 if k in exempt else compress_min_size)
+        for k, v in item.items()
+    }
+
+
+def key_attributes(table):
+    """
+    key_attributes names of table, global and local secondary index key
+    attributes, and DB_KEY_ATTRIBUTES, described once per table. None if
+    the table can not be described.
+    """
+    if table in _key_attributes:
+        return _key_attributes[table]
+    try:
+        description = db().describe_table(TableName=table)["Table"]
+    except ClientError as e:
+        logger.warning("key_attributes: %s not compressed: %s", table, e)
+        _key_attributes[table] = None
+        return None
+
+    names = set(DB_KEY_ATTRIBUTES)
+    indexes = description.get("GlobalSecondaryIndexes", []) + description.get(
+        "LocalSecondaryIndexes", []
+    )
+    for schema in [description["KeySchema"]] + [i["KeySchema"] for i in indexes]:
+        names.update(key["AttributeName"] for key in schema)
+    _key_attributes[table] = frozenset(names)
+    return _key_attributes[table]
+
+
+def put_items(table, items, key=("id",), compress_min_size=None):
+    """
+    put_items writes items with 25 item batch_write_item calls, returns stats
+    """
+    with BatchWriter(table, key=key, compress_min_size=compress_min_size) as writer:
+        for item in items:
+            writer.put_item(item)
+    return writer.stats
+
+
+class BatchWriter:
     """
-    update_item
+    BatchWriter buffers put / delete requests for table and writes them with
+    batch_write_item, flushing every flush_size (max 25) requests, on exit,
+    and when a request is added while the oldest buffered one is
+    flush_interval seconds old. There is no timer: a writer that stops
+    receiving requests keeps its buffer until flush() or exit.
+    Requests for the same key within a batch are coalesced, last one wins.
+    Unprocessed (throttled) items are retried with jittered backoff, budget
+    (CapacityBudget) paces batches by their consumed write capacity.
+
+        with BatchWriter("prompt-results-table") as writer:
+            for item in items:
+                writer.put_item(item)
+        logger.info("written: %s", writer.stats)
     """
-    db_key = {k: value_to_db_value(value) for k, value in key.items()}
-    expr_update_list = ["SET"]
-    expr_values = {}
 
-    for k, value in item.items():
-        expr_var = ":" + k
-        expr_update_list.append(k + "=" + expr_var)
+    def __init__(
+        self,
+        table,
+        key=("id",),
+        flush_size=None,
+        flush_interval=None,
+        max_retries=None,
+        compress_min_size=None,
+        budget=None,
+    ):
+        self.table = table
+        self.key = key
+        self.compress_min_size = compress_min_size
+        self.budget = budget
+        self.flush_size = min(flush_size or DB_BATCH_WRITE_SIZE, DB_BATCH_WRITE_SIZE)
+        self.flush_interval = flush_interval
+        self.max_retries = DB_MAX_RETRIES if max_retries is None else max_retries
+        self.stats = {
+            "items_written": 0,
+            "batches": 0,
+            "duplicates": 0,
+            "retries": 0,
+            "throttles": 0,
+        }
+        self._buffer = {}  # key values => write request, in arrival order
+        self._buffered_at = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+        return False
+
+    def put_item(self, item):
+        """
+        put_item buffers a put of python item
+        """
+        db_item = item_to_db_item(item, self.compress_min_size, self.table)
+        self._add(item, {"PutRequest": {"Item": db_item}})
+
+    def delete_item(self, key):
+        """
+        delete_item buffers a delete of python key {name: value}
+        """
+        db_key = {k: value_to_db_value(v, 0) for k, v in key.items()}
+        self._add(key, {"DeleteRequest": {"Key": db_key}})
+
+    def flush(self):
+        """
+        flush writes all buffered requests
+        """
+        while self._buffer:
+            requests = list(self._buffer.values())[: self.flush_size]
+            for buffer_key in list(self._buffer)[: self.flush_size]:
+                del self._buffer[buffer_key]
+            self._write(requests)
+        self._buffered_at = None
+
+    def _add(self, item, request):
+        buffer_key = tuple(item[k] for k in self.key)
+        if buffer_key in self._buffer:
+            self.stats["duplicates"] += 1
+            del self._buffer[buffer_key]  # re-insert last, keeps it in order
+        self._buffer[buffer_key] = request
+
+        if self._buffered_at is None:
+            self._buffered_at = time.monotonic()
+
+        if len(self._buffer) >= self.flush_size:
+            self.flush()
+        elif (
+            self.flush_interval is not None
+            and time.monotonic() - self._buffered_at >= self.flush_interval
+        ):
+            self.flush()
+
+    def _write(self, requests):
+        """
+        _write one batch_write_item, until no unprocessed items. Cached items
+        are invalidated once written, a get meanwhile may cache the old item
+        """
+        request_items = {self.table: requests}
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.stats["retries"] += 1
+                backoff(attempt)
+            if self.budget:
+                res = db().batch_write_item(
+                    RequestItems=request_items, ReturnConsumedCapacity="TOTAL"
+                )
+                self.budget.consume(consumed_capacity(res))
+            else:
+                res = db().batch_write_item(RequestItems=request_items)
+            self.stats["batches"] += 1
+            for request in requests:
+                for op in request.values():
+                    db_key = op.get("Key") or op.get("Item") or {}
+                    ItemCache.invalidate(self.table, db_key.get("id", {}).get("S"))
+
+            request_items = res.get("UnprocessedItems")
+            unprocessed = len(request_items[self.table]) if request_items else 0
+            self.stats["items_written"] += len(requests) - unprocessed
+            if not unprocessed:
+                return
+            self.stats["throttles"] += unprocessed
+            requests = request_items[self.table]
+            logger.warning(
+                "batch_write_item: %d unprocessed items, retry %d",
+                unprocessed,
+                attempt + 1,
+            )
 
-        logger.debug(
-            'update_item expr_values:"%s":%s', expr_var, value_to_db_value(value)
+        raise RuntimeError(
+            f"batch_write_item: {len(requests)} items of {self.table} "
+            f"unprocessed after {self.max_retries} retries"
         )
 
-        expr_values[expr_var] = value_to_db_value(value)
 
-    expr_update = " ".join(expr_update_list)
+def projection_request(cols):
+    """
+    projection_request ProjectionExpression and ExpressionAttributeNames of
+    cols, "a,b" or a tuple of names, compiled once per cols
+    """
+    names = cols if isinstance(cols, tuple) else expressions.cols_to_names(cols)
+    projection = expressions.projection(names)
+    return {
+        "ProjectionExpression": projection.expression,
+        "ExpressionAttributeNames": projection.names,
+    }
+
+
+def bind_values(expression, values):
+    """
+    bind_values ExpressionAttributeValues of a compiled expression, values
+    are python values by attribute, serialized uncompressed
+    """
+    db_values = dict(expression.constants)
+    for attribute, placeholder in expression.values:
+        db_values[placeholder] = value_to_db_value(values[attribute], 0)
+    return db_values
 
-    logger.debug("update_item table=%s key=%s", table, json_str(key))
-    logger.debug("update_item expr_update=%s", json_str(expr_update))
-    logger.debug("update_item expr_values=%s", json_str(expr_values))
 
-    res = db.update_item(
-        TableName=table,
-        Key=db_key,
-        UpdateExpression=expr_update,
-        ExpressionAttributeValues=expr_values,
-        ReturnValues="UPDATED_NEW",
+def update_item(
+    table,
+    key,
+    item=None,
+    add=None,
+    remove=None,
+    if_not_exists=None,
+    append=None,
+    expected=None,
+    return_values="UPDATED_NEW",
+):
+    """
+    update_item SETs item attributes, ADDs add numbers / sets, REMOVEs remove
+    attributes, SETs if_not_exists attributes only when missing and appends
+    append lists. expected {attribute: value or expressions.EXISTS /
+    expressions.NOT_EXISTS} conditions the update. Expressions are compiled
+    and cached by the attribute names, returns the http status.
+    """
+    item, add, if_not_exists, append = (
+        item or {},
+        add or {},
+        if_not_exists or {},
+        append or {},
     )
+    update = expressions.update(
+        tuple(item),
+        tuple(add),
+        tuple(remove or ()),
+        tuple(if_not_exists),
+        tuple(append),
+    )
+    request = {
+        "TableName": table,
+        "Key": {k: value_to_db_value(value, 0) for k, value in key.items()},
+        "UpdateExpression": update.expression,
+        "ExpressionAttributeNames": dict(update.names),
+        "ReturnValues": return_values,
+    }
+    values = bind_values(update, {**item, **add, **if_not_exists, **append})
+
+    if expected:
+        condition = expressions.condition(expressions.condition_shape(expected))
+        request["ConditionExpression"] = condition.expression
+        request["ExpressionAttributeNames"].update(condition.names)
+        values.update(bind_values(condition, expected))
+    if values:
+        request["ExpressionAttributeValues"] = values
+
+    logger.debug("update_item %s %s: %s", table, key, update.expression)
+    res = db().update_item(**request)
+    ItemCache.invalidate(table, key.get("id"))
 
     try:
         status = res["ResponseMetadata"]["HTTPStatusCode"]
     except KeyError:
-        logger.error("unknown response : %s", json_str(res))
+        logger.error("unknown response : %s", json_log(res))
         status = 500  # internal error
 
-    logger.info("put_item res: %s", json_str(res))
+    logger.debug("update_item res: %s", json_log(res))
     return status
+
+
+def transact_put(table, item, condition=None, compress_min_size=None):
+    """
+    transact_put Put request of item for transact_write
+    """
+    request = {
+        "TableName": table,
+        "Item": item_to_db_item(item, compress_min_size, table),
+    }
+    if condition:
+        request["ConditionExpression"] = condition
+    return {"Put": request}
+
+
+def transact_update(table, key, update, values=None, names=None, condition=None):
+    """
+    transact_update Update request of key for transact_write, values are
+    python values serialized uncompressed
+    """
+    request = {
+        "TableName": table,
+        "Key": {k: value_to_db_value(value, 0) for k, value in key.items()},
+        "UpdateExpression": update,
+    }
+    if values:
+        request["ExpressionAttributeValues"] = {
+            k: value_to_db_value(value, 0) for k, value in values.items()
+        }
+    if names:
+        request["ExpressionAttributeNames"] = names
+    if condition:
+        request["ConditionExpression"] = condition
+        request["ReturnValuesOnConditionCheckFailure"] = "ALL_OLD"
+    return {"Update": request}
+
+
+def transact_write(requests, max_retries=None):
+    """
+    transact_write writes up to 100 transact_put / transact_update requests
+    all or nothing with one transact_write_items round trip, retrying
+    transaction conflicts with backoff. Raises ClientError when cancelled,
+    e.response["CancellationReasons"] has a reason per request.
+    """
+    max_retries = DB_MAX_RETRIES if max_retries is None else max_retries
+
+    for attempt in range(max_retries + 1):
+        if attempt:
+            backoff(attempt)
+        try:
+            res = db().transact_write_items(TransactItems=requests)
+            break
+        except ClientError as e:
+            reasons = e.response.get("CancellationReasons") or []
+            codes = [reason.get("Code") for reason in reasons]
+            if "TransactionConflict" not in codes or attempt == max_retries:
+                raise
+            logger.warning("transact_write: conflict, retry %d", attempt + 1)
+
+    for request in requests:
+        for op in request.values():
+            db_key = op.get("Key") or op.get("Item") or {}
+            item_id = db_key.get("id", {}).get("S")
+            ItemCache.invalidate(op["TableName"], item_id)
+
+    logger.debug("transact_write res: %s", json_log(res))
+    return res
@@ -1,13 +1,25 @@
 """
 event
 """
+import json
 import logging
-from functools import reduce
+from functools import lru_cache
 
-from misc_utils import json_str
+from misc_utils import json_log
 
 logger = logging.getLogger(__name__)
 
+#
+# extraction specs, {job name: dotted path into the record}, are compiled once
+# into accessor functions (see compile_path, compile_job_parser)
+#
+S3_EVENT_KEYS = {"s3ObjectKey": "s3.object.key", "s3BucketName": "s3.bucket.name"}
+DYNAMODB_EVENT_KEYS = {
+    "prompt_id": "dynamodb.OldImage.prompt_id.S",
+    "id": "dynamodb.Keys.id.S",
+    "eventSourceARN": "eventSourceARN",
+}
+
 
 def s3_event(event_record):
     """
@@ -29,8 +41,7 @@ def s3_event(event_record):
         }
     }
     """
-    event_keys = {"s3ObjectKey": "s3.object.key", "s3BucketName": "s3.bucket.name"}
-    return event_process(event_record, type_key="s3", event_keys=event_keys)
+    return _parse_s3_event(event_record)
 
 
 def s3_test_event(event_record):
@@ -54,18 +65,90 @@ def dyanamodb_stream_event(event_record):
     """
     dyanamodb_stream_event
     """
-
-    event_keys = {
-        "prompt_id": "dynamodb.OldImage.prompt_id.S",
-    }
-    job = event_process(event_record, type_key="dynamodb", event_keys=event_keys)
+    job = _parse_dynamodb_event(event_record)
 
     # ttl is not suppolied by dyanamodb_stream_event - mark it as missing
     if job:
         job["ttl"] = None
+        job["table"] = arn_to_table(job.get("eventSourceARN"))
     return job
 
 
+def sqs_event(event_record):
+    """
+    sqs_event converts an sqs message record into job, with the s3 jobs of
+    an s3 notification body (direct or sns wrapped) in job["jobs"]
+    {
+        "messageId": "059f36b4-87a3-44ab-83d2-661975830a7d",
+        "receiptHandle": "AQEBwJnKyrHigUMZj6rYigCgxlaS3SLy0a...",
+        "body": "{\"Records\": [{\"eventSource\": \"aws:s3\", ...}]}",
+        "eventSource": "aws:sqs",
+        "eventSourceARN": "arn:aws:sqs:us-west-2:123456789012:my-queue",
+        ...
+    }
+    """
+    if event_record.get("eventSource") != "aws:sqs" or "messageId" not in event_record:
+        logger.error("event malformed - not an sqs message")
+        return False
+
+    job = {
+        "eventType": "sqs",
+        "eventSource": "aws:sqs",
+        "eventName": "sqs:Message",
+        "messageId": event_record["messageId"],
+        "eventSourceARN": event_record.get("eventSourceARN"),
+        "body": _sqs_body(event_record.get("body")),
+    }
+    body = job["body"]
+    if isinstance(body, dict):
+        if body.get("Event") == "s3:TestEvent":  # sent on notification setup
+            job["jobs"] = []
+        elif isinstance(body.get("Records"), list):
+            job["jobs"] = [
+                dict(s3_job, messageId=job["messageId"]) if s3_job else s3_job
+                for s3_job in parse_records(body["Records"], types=("s3",))
+            ]
+    return job
+
+
+def _sqs_body(body):
+    """
+    _sqs_body json decoded message body, unwrapping sns notifications
+    """
+    for _ in range(2):  # sqs body, then the sns message it may wrap
+        if not isinstance(body, str):
+            return body
+        try:
+            decoded = json.loads(body)
+        except ValueError:
+            return body
+        if isinstance(decoded, dict) and decoded.get("Type") == "Notification":
+            body = decoded.get("Message")
+        else:
+            return decoded
+    return body
+
+
+def is_sqs_record(event_record):
+    """
+    is_sqs_record True for records of an sqs event source mapping
+    """
+    if not isinstance(event_record, dict):
+        return False
+    return event_record.get("eventSource") == "aws:sqs"
+
+
+@lru_cache(maxsize=64)
+def arn_to_table(arn):
+    """
+    arn_to_table name from table or stream arn
+        arn:aws:dynamodb:us-west-2:123456789012:table/prompts-table/stream/...
+    """
+    if not arn or ":table/" not in arn:
+        return None
+    return arn.split(":table/", 1)[1].split("/", 1)[0]
+
+
 def dyanamodb_stream_test_event(event_record):
     """
     dyanamodb_stream_test_event
@@ -80,12 +163,80 @@ def deep_get(dictionary, keys, default=None, delimiter=None):
     """
     get values for nested dict keys
     """
-    delimiter = delimiter or "."
-    return reduce(
-        lambda d, key: d.get(key, default) if isinstance(d, dict) else default,
-        keys.split(delimiter),
-        dictionary,
-    )
+    value = compile_path(keys, delimiter or ".")(dictionary)
+    return default if value is None else value
+
+
+@lru_cache(maxsize=1024)
+def compile_path(keys, delimiter="."):
+    """
+    compile_path accessor function of dotted keys path, returns None when
+    the path is missing or goes through a non dict value
+    """
+    path = tuple(keys.split(delimiter))
+
+    def walk(obj):
+        for key in path:
+            if not isinstance(obj, dict):
+                return None
+            obj = obj.get(key)
+        return obj
+
+    if len(path) == 1:
+        (key,) = path
+
+        def get(obj):
+            return obj.get(key) if isinstance(obj, dict) else None
+
+        return get
+
+    def get_fast(obj):  # nested lookups, walk only on a miss
+        try:
+            value = obj
+            for key in path:
+                value = value[key]
+        except (KeyError, TypeError):
+            return walk(obj)
+        return value
+
+    return get_fast
+
+
+@lru_cache(maxsize=256)
+def compile_job_parser(type_key, type_name, event_keys):
+    """
+    compile_job_parser function of a record returning its job, or False,
+    like event_process (sanity check and extraction of event_keys, a tuple of
+    (name, dotted keys path) pairs) without per record setup
+    """
+    accessors = tuple((name, key_, compile_path(key_)) for name, key_ in event_keys)
+
+    def parse(record):
+        if type_key not in record:
+            logger.error("event malformed - missing required key: %s", type_key)
+            return False
+        if record.get("skip-event"):
+            logger.info("event skip flag set - event skipped...")
+            return False
+        try:
+            job = {
+                "eventType": type_name,
+                "eventSource": record["eventSource"],
+                "eventName": record["eventName"],
+            }
+        except KeyError:
+            logger.error("Invalid event missing eventSource or eventName")
+            return False
+
+        for name, key_, get in accessors:
+            value_ = get(record)
+            if value_:
+                job[name] = value_
+            else:
+                logger.error("missing %s in %s event", key_, job["eventName"])
+        return job
+
+    return parse
 
 
 def event_sanity_check(event_record, type_key=None, type_name=None):
@@ -93,7 +244,7 @@ def event_sanity_check(event_record, type_key=None, type_name=None):
     Test event by type key, in addition to existance of eventSource and
         eventName aws mandatory keys
     """
-    logger.info("event_sanity_check >> type_key :%s type_name %s", type_key, type_name)
+    logger.debug("event_sanity_check >> type_key :%s type_name %s", type_key, type_name)
     if type_key not in event_record:
         logger.error("event malformed - missing required key: %s", type_key)
         return False
@@ -121,17 +272,57 @@ def event_process(event_record, type_key, type_name=None, event_keys=None):
         deep key value extraction for processing
     """
     type_name = type_name or type_key
+    job = compile_job_parser(type_key, type_name, tuple(event_keys.items()))(
+        event_record
+    )
+    if job:
+        logger.debug("event_process >> job :%s", json_log(job))
+    return job
 
-    job = event_sanity_check(event_record, type_key, type_name)
-    if not job or job["eventType"] != type_name:
-        return False
 
-    for name, key_ in event_keys.items():
-        value_ = deep_get(event_record, key_)
-        if value_:
-            job[name] = value_
-        else:
-            logger.error("missing %s in %s event", key_, job["eventName"])
+_parse_s3_event = compile_job_parser("s3", "s3", tuple(S3_EVENT_KEYS.items()))
+_parse_dynamodb_event = compile_job_parser(
+    "dynamodb", "dynamodb", tuple(DYNAMODB_EVENT_KEYS.items())
+)
 
-    logger.info("event_process >> job :%s", json_str(job))
-    return job
+#
+# parse_records dispatches each record to the parser of the first type key
+# it holds, instead of trying parsers in turn (each failure logs an error).
+# sqs records have no type key, they are told by their eventSource
+#
+RECORD_PARSERS = {
+    "s3": s3_event,
+    "s3-test": s3_test_event,
+    "dynamodb": dyanamodb_stream_event,
+    "dynamodb-test": dyanamodb_stream_test_event,
+    "sqs": sqs_event,
+}
+
+
+def parse_records(records, types=None):
+    """
+    parse_records turns an event Records list into a list of jobs in one pass,
+    one per record, False for records of no (or not one of types) type
+    """
+    parsers = [
+        (type_key, parser)
+        for type_key, parser in RECORD_PARSERS.items()
+        if (types is None or type_key in types) and type_key != "sqs"
+    ]
+    parse_sqs = types is None or "sqs" in types
+    jobs = []
+    for record in records or []:
+        job = False
+        if parse_sqs and is_sqs_record(record):
+            job = sqs_event(record)
+        elif isinstance(record, dict):
+            for type_key, parser in parsers:
+                if type_key in record:
+                    job = parser(record)
+                    break
+        jobs.append(job)
+
+    if jobs:
+        parsed = sum(1 for job in jobs if job)
+        logger.info("parse_records: %d of %d records parsed", parsed, len(jobs))
+    return jobs
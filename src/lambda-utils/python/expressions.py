@@ -0,0 +1,151 @@
+"""
+compiled dynamodb expressions
+
+Update, projection and condition expressions are compiled from the shape of
+a request, the attribute names per clause, into an expression template with
+#n / :v placeholders. Templates are cached by shape, so repeated requests
+only bind their values. Every attribute goes through ExpressionAttributeNames,
+so reserved words (name, status, ttl, ...) are safe.
+"""
+from collections import namedtuple
+from functools import lru_cache
+
+EXISTS = "attribute_exists"
+NOT_EXISTS = "attribute_not_exists"
+
+Expression = namedtuple("Expression", ["expression", "names", "values", "constants"])
+Expression.__doc__ = """
+compiled expression: expression string, ExpressionAttributeNames, the
+(attribute, placeholder) pairs to bind values of, and constant db values
+"""
+
+
+def cols_to_names(cols):
+    """
+    cols_to_names tuple of attribute names from "a,b" string or iterable
+    """
+    if isinstance(cols, str):
+        cols = cols.split(",")
+    return tuple(col.strip() for col in cols if col.strip())
+
+
+class _Compiler:
+    """
+    _Compiler allocates #n / :v placeholders for one expression
+    """
+
+    def __init__(self, name_prefix="#n", value_prefix=":v"):
+        self.name_prefix = name_prefix
+        self.value_prefix = value_prefix
+        self.names = {}  # placeholder => name
+        self.paths = {}  # path => placeholder path
+        self.values = []  # (attribute, placeholder)
+        self.constants = {}  # placeholder => db value
+
+    def path(self, path):
+        """
+        path placeholder of a, or of nested a.b
+        """
+        if path not in self.paths:
+            parts = []
+            for name in path.split("."):
+                placeholder = f"{self.name_prefix}{len(self.names)}"
+                self.names[placeholder] = name
+                parts.append(placeholder)
+            self.paths[path] = ".".join(parts)
+        return self.paths[path]
+
+    def value(self, attribute):
+        """
+        value placeholder bound to attribute
+        """
+        placeholder = f"{self.value_prefix}{len(self.values)}"
+        self.values.append((attribute, placeholder))
+        return placeholder
+
+    def constant(self, name, db_value):
+        """
+        constant placeholder of a fixed db value
+        """
+        placeholder = f"{self.value_prefix}{name}"
+        self.constants[placeholder] = db_value
+        return placeholder
+
+    def compile(self, expression):
+        """
+        compile Expression
+        """
+        return Expression(
+            expression, dict(self.names), tuple(self.values), dict(self.constants)
+        )
+
+
+@lru_cache(maxsize=256)
+def projection(cols):
+    """
+    projection expression of cols, a tuple of attribute names (see cols_to_names)
+    """
+    compiler = _Compiler("#p")
+    return compiler.compile(",".join(compiler.path(col) for col in cols))
+
+
+@lru_cache(maxsize=256)
+def update(set_=(), add=(), remove=(), if_not_exists=(), append=()):
+    """
+    update expression, each clause a tuple of attribute names:
+    set_ SET #a = :v, if_not_exists SET #a = if_not_exists(#a, :v),
+    append SET #a = list_append(if_not_exists(#a, :empty), :v),
+    add ADD #a :v (numbers and sets) and remove REMOVE #a
+    """
+    compiler = _Compiler()
+    sets = [f"{compiler.path(a)} = {compiler.value(a)}" for a in set_]
+    for attribute in if_not_exists:
+        path = compiler.path(attribute)
+        sets.append(f"{path} = if_not_exists({path}, {compiler.value(attribute)})")
+    for attribute in append:
+        path = compiler.path(attribute)
+        empty = compiler.constant("empty", {"L": []})
+        sets.append(
+            f"{path} = list_append(if_not_exists({path}, {empty}), "
+            f"{compiler.value(attribute)})"
+        )
+
+    clauses = []
+    if sets:
+        clauses.append("SET " + ", ".join(sets))
+    if add:
+        adds = [f"{compiler.path(a)} {compiler.value(a)}" for a in add]
+        clauses.append("ADD " + ", ".join(adds))
+    if remove:
+        clauses.append("REMOVE " + ", ".join(compiler.path(a) for a in remove))
+
+    if not clauses:
+        raise ValueError("update: empty update expression")
+    return compiler.compile(" ".join(clauses))
+
+
+@lru_cache(maxsize=256)
+def condition(shape):
+    """
+    condition expression AND-ing (attribute, kind) pairs of shape, kind is
+    EXISTS, NOT_EXISTS or "=" to compare with a bound value
+    """
+    compiler = _Compiler("#c", ":c")
+    terms = []
+    for attribute, kind in shape:
+        path = compiler.path(attribute)
+        if kind in (EXISTS, NOT_EXISTS):
+            terms.append(f"{kind}({path})")
+        else:
+            terms.append(f"{path} = {compiler.value(attribute)}")
+    return compiler.compile(" AND ".join(terms))
+
+
+def condition_shape(expected):
+    """
+    condition_shape of expected {attribute: value or EXISTS / NOT_EXISTS}
+    """
+    return tuple(
+        (attribute, value if value in (EXISTS, NOT_EXISTS) else "=")
+        for attribute, value in expected.items()
+    )
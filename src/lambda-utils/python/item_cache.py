@@ -0,0 +1,158 @@
+"""
+in-process read-through cache of dynamodb items for warm lambdas
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ItemCache:
+    """
+    ItemCache TTL + LRU cache of dynamodb.get_item / get_items results, for
+    tables configured with ItemCache.configure. Items are keyed by id and
+    projection, and invalidated on local writes and by dynamodb stream jobs
+    parsed with events.dyanamodb_stream_event.
+    """
+
+    _lock = threading.RLock()
+    _tables = {}  # table => {ttl, max_items}
+    _entries = {}  # table => OrderedDict id => {cols: (expires_at, item)}, LRU first
+    _stats = {}  # table => counters
+
+    def __init__(self):
+        """
+        singlton __init__ is forbidden
+        """
+        raise RuntimeError("Singleton, use methods directly")
+
+    @classmethod
+    def configure(cls, table, ttl=300, max_items=1024):
+        """
+        configure caching of table items for ttl seconds, up to max_items ids
+        """
+        with cls._lock:
+            cls._tables[table] = {"ttl": ttl, "max_items": max_items}
+            cls._entries.setdefault(table, OrderedDict())
+            cls._stats.setdefault(
+                table,
+                {
+                    "hits": 0,
+                    "misses": 0,
+                    "expired": 0,
+                    "evictions": 0,
+                    "invalidations": 0,
+                },
+            )
+        logger.info("ItemCache: %s ttl %s max_items %s", table, ttl, max_items)
+
+    @classmethod
+    def disable(cls, table):
+        """
+        disable caching of table, dropping its items
+        """
+        with cls._lock:
+            cls._tables.pop(table, None)
+            cls._entries.pop(table, None)
+
+    @classmethod
+    def enabled(cls, table):
+        """
+        enabled is True if table items are cached
+        """
+        return table in cls._tables
+
+    @classmethod
+    def get(cls, table, item_id, cols=None):
+        """
+        get cached item or None on miss
+        """
+        with cls._lock:
+            entries = cls._entries.get(table)
+            if entries is None:
+                return None
+            stats = cls._stats[table]
+
+            cached = entries.get(item_id, {}).get(cols)
+            if cached is None:
+                stats["misses"] += 1
+                return None
+
+            expires_at, item = cached
+            if expires_at < time.monotonic():
+                del entries[item_id][cols]
+                stats["expired"] += 1
+                stats["misses"] += 1
+                return None
+
+            entries.move_to_end(item_id)
+            stats["hits"] += 1
+            return dict(item)  # callers may update the item they get
+
+    @classmethod
+    def put(cls, table, item_id, item, cols=None):
+        """
+        put a copy of item fetched from table into cache
+        """
+        if item is None:
+            return
+        with cls._lock:
+            config = cls._tables.get(table)
+            if config is None:
+                return
+            entries = cls._entries[table]
+            expires_at = time.monotonic() + config["ttl"]
+            entries.setdefault(item_id, {})[cols] = (expires_at, dict(item))
+            entries.move_to_end(item_id)
+
+            while len(entries) > config["max_items"]:
+                entries.popitem(last=False)
+                cls._stats[table]["evictions"] += 1
+
+    @classmethod
+    def invalidate(cls, table, item_id):
+        """
+        invalidate all cached projections of item_id
+        """
+        with cls._lock:
+            entries = cls._entries.get(table)
+            if entries is not None and entries.pop(item_id, None) is not None:
+                cls._stats[table]["invalidations"] += 1
+                logger.debug("ItemCache: invalidate %s %s", table, item_id)
+
+    @classmethod
+    def invalidate_event(cls, job):
+        """
+        invalidate the item of a job parsed by events.dyanamodb_stream_event,
+        returns True if the job names a cached table item
+        """
+        if not job or not job.get("table") or not job.get("id"):
+            return False
+        if not cls.enabled(job["table"]):
+            return False
+        cls.invalidate(job["table"], job["id"])
+        return True
+
+    @classmethod
+    def clear(cls, table=None):
+        """
+        clear cached items of table, or of all tables
+        """
+        with cls._lock:
+            for name, entries in cls._entries.items():
+                if table is None or name == table:
+                    entries.clear()
+
+    @classmethod
+    def stats(cls, table=None):
+        """
+        stats counters and size per table, or of table
+        """
+        with cls._lock:
+            stats = {
+                name: dict(counters, items=len(cls._entries.get(name, ())))
+                for name, counters in cls._stats.items()
+            }
+        return stats.get(table) if table else stats
@@ -7,10 +7,19 @@ import hashlib
 import json
 import logging
 import os
+import random
 import zipfile
 
 logger = logging.getLogger(__name__)
 
+#
+# log payloads are serialized lazily, when a record is emitted, as compact one
+# line json: lists beyond LOG_MAX_ITEMS items are sampled and strings or whole
+# payloads beyond LOG_MAX_CHARS are truncated
+#
+LOG_MAX_ITEMS = int(os.environ.get("LOG_MAX_ITEMS", 20))
+LOG_MAX_CHARS = int(os.environ.get("LOG_MAX_CHARS", 4096))
+
 
 class JsonEncoder(json.JSONEncoder):
     """
@@ -25,9 +34,11 @@ class JsonEncoder(json.JSONEncoder):
 
 def hash_id(data):
     """
-    generate a somewhat short alphanumeric id from text
+    generate a somewhat short alphanumeric id from text (or utf-8 bytes)
     """
-    id_from_data = base64.urlsafe_b64encode(hashlib.md5(data.encode("utf-8")).digest())
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    id_from_data = base64.urlsafe_b64encode(hashlib.md5(data).digest())
     id_from_data = id_from_data.decode("ascii")
     logger.debug("generated id : %s", id_from_data)
     return id_from_data
@@ -38,6 +49,8 @@ def json_encode_obj(obj):
     JsonEncodeObj for complex data types
     {cls.__module_}.
     """
+    if isinstance(obj, decimal.Decimal):  # default= takes over JsonEncoder's
+        return float(obj)
     cls = obj.__class__
     return f"<{cls.__qualname__} obj at {id(obj)}>"
 
@@ -51,6 +64,75 @@ def json_str(obj):
     )
 
 
+class LazyJson:
+    """
+    LazyJson logging argument, serialized by str() only if the record is emitted
+    usage: logger.info("item: %s", json_log(item))
+    """
+
+    __slots__ = ("obj", "max_items", "max_chars")
+
+    def __init__(self, obj, max_items=None, max_chars=None):
+        self.obj = obj
+        self.max_items = max_items or LOG_MAX_ITEMS
+        self.max_chars = max_chars or LOG_MAX_CHARS
+
+    def __str__(self):
+        text = json.dumps(
+            _log_sample(self.obj, self.max_items, self.max_chars),
+            separators=(",", ":"),
+            default=json_encode_obj,
+            cls=JsonEncoder,
+        )
+        if len(text) > self.max_chars:
+            text = f"{text[:self.max_chars]}...({len(text)} chars)"
+        return text
+
+
+def json_log(obj, max_items=None, max_chars=None):
+    """
+    json_log lazy, compact and truncated json of obj for logging arguments
+    """
+    return LazyJson(obj, max_items, max_chars)
+
+
+def _log_sample(obj, max_items, max_chars):
+    """
+    _log_sample copy of obj with long lists sampled and long strings truncated
+    """
+    if isinstance(obj, str):
+        if len(obj) > max_chars:
+            return f"{obj[:max_chars]}...({len(obj)} chars)"
+        return obj
+    if isinstance(obj, (bytes, bytearray)):
+        return f"<{len(obj)} bytes>"
+    if isinstance(obj, dict):
+        return {k: _log_sample(v, max_items, max_chars) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        items = [_log_sample(v, max_items, max_chars) for v in list(obj)[:max_items]]
+        if len(obj) > max_items:
+            items.append(f"...({len(obj)} items)")
+        return items
+    return obj
+
+
+def reservoir_sample(iterable, k, rng=None):
+    """
+    reservoir_sample k items uniformly from iterable of unknown length,
+    in one pass and O(k) memory (Algorithm R)
+    """
+    rng = rng or random
+    sample = []
+    for i, item in enumerate(iterable):
+        if i < k:
+            sample.append(item)
+        else:
+            j = rng.randint(0, i)
+            if j < k:
+                sample[j] = item
+    return sample
+
+
 def get_from_object(obj, path):
     """
     get_from_object
@@ -61,7 +143,7 @@ def get_from_object(obj, path):
             break
         obj = obj[key] if key in obj else None
 
-    logger.info("get_from_object %s => %s", path, json_str(obj))
+    logger.info("get_from_object %s => %s", path, json_log(obj))
     return obj
 
 
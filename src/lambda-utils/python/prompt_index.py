@@ -0,0 +1,406 @@
+"""
+in-memory (task, type, via) => prompts index for warm lambdas
+"""
+import gzip
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+import dynamodb
+from aws_clients import get_client
+from botocore.exceptions import BotoCoreError, ClientError
+from events import arn_to_table
+from misc_utils import JsonEncoder
+from s3 import s3_open
+
+logger = logging.getLogger(__name__)
+
+#
+# get_prompts is a GSI query on prompt-lookup-table then a batch get on
+# prompts-table. With PROMPT_INDEX_ENABLED both tables are loaded once per
+# container (from the PROMPT_INDEX_URL snapshot when fresh, else by scan) and
+# kept current by polling their dynamodb streams every PROMPT_INDEX_REFRESH
+# seconds, so get_prompts is a local lookup and random pick
+#
+PROMPT_INDEX_ENABLED = os.environ.get("PROMPT_INDEX_ENABLED", "false").lower() == "true"
+PROMPT_INDEX_URL = os.environ.get("PROMPT_INDEX_URL", "")  # s3://bucket/key.json.gz
+PROMPT_INDEX_MAX_AGE = int(os.environ.get("PROMPT_INDEX_MAX_AGE", 3600))
+PROMPT_INDEX_REFRESH = float(os.environ.get("PROMPT_INDEX_REFRESH", 10))
+
+LOOKUP_TABLE = "prompt-lookup-table"
+PROMPTS_TABLE = "prompts-table"
+LOOKUP_COLS = ("id", "task_", "type_", "via_", "prompt_ids")
+PROMPT_COLS = ("id", "template", "actors", "res_id")
+
+
+class PromptIndex:
+    """
+    PromptIndex of prompt-lookup-table and prompts-table items, see
+    PROMPT_INDEX_* settings. apply_record also takes records from stream
+    triggered lambdas. Prompts missing from the index are fetched on demand.
+    """
+
+    _lock = threading.RLock()
+    _load_lock = threading.Lock()
+    _poll_lock = threading.Lock()
+    _lookups = {}  # lookup id => lookup item
+    _keys = {}  # (task_, type_) => {lookup id: prompt id}
+    _prompts = {}  # prompt id => prompt item
+    _streams = {}  # table => {shard id: shard iterator}
+    _parents = {}  # shard id => parent shard id, read after its parent
+    _since = None  # stream records older than the loaded state are skipped
+    _loaded_at = None
+    _polled_at = 0
+    _stats = {"loads": 0, "snapshots": 0, "records": 0, "fetched": 0}
+
+    def __init__(self):
+        """
+        singlton __init__ is forbidden
+        """
+        raise RuntimeError("Singleton, use methods directly")
+
+    @classmethod
+    def enabled(cls):
+        """
+        enabled is True if get_prompts is served by the index
+        """
+        return PROMPT_INDEX_ENABLED
+
+    @classmethod
+    def get_prompts(cls, task_, type_, via_=None, do_random=True, do_limit=1):
+        """
+        get_prompts like prompts.get_prompts, from the index
+        """
+        cls.ensure_loaded()
+        with cls._lock:
+            prompt_ids = [
+                prompt_id
+                for lookup_id, prompt_id in cls._keys.get((task_, type_), {}).items()
+                if not via_ or cls._lookups[lookup_id].get("via_") == via_
+            ]
+        if do_random and do_limit and len(prompt_ids) > do_limit:
+            prompt_ids = random.sample(prompt_ids, do_limit)
+        elif do_limit:
+            prompt_ids = prompt_ids[:do_limit]
+        if not prompt_ids:
+            return None
+
+        with cls._lock:
+            found = {
+                pid: cls._prompts[pid] for pid in prompt_ids if pid in cls._prompts
+            }
+        missing = [pid for pid in prompt_ids if pid not in found]
+        if missing:
+            cols = ",".join(PROMPT_COLS)
+            for prompt in filter(
+                None, dynamodb.get_items(PROMPTS_TABLE, missing, cols=cols) or []
+            ):
+                found[prompt["id"]] = cls._put_prompt(prompt)
+            cls._stats["fetched"] += len(missing)
+
+        return [dict(found[pid]) for pid in prompt_ids if pid in found] or None
+
+    @classmethod
+    def ensure_loaded(cls):
+        """
+        ensure_loaded loads the index when missing or older than
+        PROMPT_INDEX_MAX_AGE, or polls the streams when due
+        """
+        if cls._stale():
+            with cls._load_lock:
+                if cls._stale():  # not loaded by another thread meanwhile
+                    cls.load()
+        elif (
+            PROMPT_INDEX_REFRESH and time.time() - cls._polled_at > PROMPT_INDEX_REFRESH
+        ):
+            cls.poll()
+
+    @classmethod
+    def _stale(cls):
+        loaded_at = cls._loaded_at
+        if loaded_at is None:
+            return True
+        return PROMPT_INDEX_MAX_AGE and time.time() - loaded_at > PROMPT_INDEX_MAX_AGE
+
+    @classmethod
+    def load(cls, url=None):
+        """
+        load the index from the snapshot at url (PROMPT_INDEX_URL) when not
+        older than PROMPT_INDEX_MAX_AGE, else by scanning both tables
+        """
+        started = time.time()
+        snapshot = cls._read_snapshot(url or PROMPT_INDEX_URL)
+        if snapshot:
+            lookups, prompts = snapshot["lookups"], snapshot["prompts"]
+            # changes made since the snapshot are replayed from the streams,
+            # record times are rounded down to the second
+            since = snapshot["created_at"] - 1
+            cls._stats["snapshots"] += 1
+        else:
+            since = None
+
+        # streams are opened before scanning, changes made meanwhile are replayed
+        streams = {}
+        if PROMPT_INDEX_REFRESH:
+            streams = cls._open_streams("TRIM_HORIZON" if snapshot else "LATEST")
+        if not snapshot:
+            lookups, prompts = cls._scan_tables()
+
+        with cls._lock:
+            cls._lookups, cls._keys, cls._prompts = {}, {}, {}
+            for lookup in lookups:
+                cls._put_lookup(lookup)
+            for prompt in prompts:
+                cls._put_prompt(prompt)
+            cls._streams, cls._since = streams, since
+            cls._loaded_at = cls._polled_at = time.time()
+        cls._stats["loads"] += 1
+        if snapshot and streams:
+            with cls._poll_lock:
+                cls._read_streams(until=started)  # catch up before serving
+
+        logger.info(
+            "PromptIndex: loaded %d lookups %d prompts in %.3fs%s",
+            len(lookups),
+            len(prompts),
+            time.time() - started,
+            " from snapshot" if snapshot else "",
+        )
+
+    @classmethod
+    def snapshot(cls, url=None):
+        """
+        snapshot both tables into a gzipped json object at url (PROMPT_INDEX_URL)
+        for cold starts to load, returns the url
+        """
+        url = url or PROMPT_INDEX_URL
+        if not url:
+            raise ValueError("snapshot: url or PROMPT_INDEX_URL required")
+        created_at = time.time()  # before scanning, loads replay changes since
+        lookups, prompts = cls._scan_tables()
+        data = {"created_at": created_at, "lookups": lookups, "prompts": prompts}
+        with s3_open(url, "wb") as snapshot_file:
+            snapshot_file.write(
+                gzip.compress(
+                    json.dumps(data, separators=(",", ":"), cls=JsonEncoder).encode()
+                )
+            )
+        logger.info(
+            "PromptIndex: snapshot %d lookups %d prompts to %s",
+            len(lookups),
+            len(prompts),
+            url,
+        )
+        return url
+
+    @classmethod
+    def poll(cls):
+        """
+        poll applies new stream records of both tables. A failed poll (for
+        example expired shard iterators) reloads the index right away, so
+        lookups never serve an index that stopped following the streams.
+        Connection errors and timeouts keep the index, the next poll retries
+        """
+        if not cls._poll_lock.acquire(blocking=False):
+            return  # another thread is polling
+        cls._polled_at = time.time()
+        try:
+            cls._read_streams()
+        except ClientError as e:
+            logger.warning("PromptIndex: poll failed, reloading: %s", e)
+            cls._loaded_at = None
+        except BotoCoreError as e:  # iterators are unchanged, still valid
+            logger.warning("PromptIndex: poll failed, retrying next poll: %s", e)
+        finally:
+            cls._poll_lock.release()
+        if cls._loaded_at is None:
+            cls.ensure_loaded()
+
+    @classmethod
+    def _read_streams(cls, until=None):
+        """
+        _read_streams applies the next records of every shard, reading on
+        while a shard returns records older than until (catching up)
+        """
+        client = cls._streams_client()
+        for table, iterators in cls._streams.items():
+            for shard_id in list(iterators):
+                if cls._parents.get(shard_id) in iterators:
+                    continue  # parent records first, keeps per key order
+                while shard_id in iterators:
+                    res = client.get_records(ShardIterator=iterators[shard_id])
+                    records = res.get("Records", [])
+                    for record in records:
+                        if cls._since is None or _record_time(record) >= cls._since:
+                            cls.apply_record(record, table)
+                    if res.get("NextShardIterator"):
+                        iterators[shard_id] = res["NextShardIterator"]
+                    else:  # shard closed, continue with its children
+                        del iterators[shard_id]
+                        cls._add_shards(table, iterators, "TRIM_HORIZON")
+                    if not (until and records and _record_time(records[-1]) < until):
+                        break
+
+    @classmethod
+    def apply_record(cls, record, table=None):
+        """
+        apply_record dynamodb stream record of either table to the index,
+        returns True if applied
+        """
+        table = table or arn_to_table(record.get("eventSourceARN"))
+        stream = record.get("dynamodb", {})
+        item_id = stream.get("Keys", {}).get("id", {}).get("S")
+        if table not in (LOOKUP_TABLE, PROMPTS_TABLE) or not item_id:
+            return False
+
+        image = stream.get("NewImage")
+        item = dynamodb.deserialize_item(image) if image else None
+        with cls._lock:
+            if table == LOOKUP_TABLE:
+                cls._remove_lookup(item_id)
+                if item and record.get("eventName") != "REMOVE":
+                    cls._put_lookup(item)
+            else:  # without a new image the prompt is fetched on demand
+                cls._prompts.pop(item_id, None)
+                if item and record.get("eventName") != "REMOVE":
+                    cls._put_prompt(item)
+        cls._stats["records"] += 1
+        return True
+
+    @classmethod
+    def clear(cls):
+        """
+        clear the index, the next lookup reloads it
+        """
+        with cls._lock:
+            cls._lookups, cls._keys, cls._prompts, cls._streams = {}, {}, {}, {}
+            cls._parents, cls._since, cls._loaded_at = {}, None, None
+
+    @classmethod
+    def stats(cls):
+        """
+        stats counters and sizes
+        """
+        with cls._lock:
+            return dict(
+                cls._stats,
+                lookups=len(cls._lookups),
+                prompts=len(cls._prompts),
+                loaded_at=cls._loaded_at,
+            )
+
+    @classmethod
+    def _put_lookup(cls, lookup):
+        lookup = {k: lookup.get(k) for k in LOOKUP_COLS}
+        cls._lookups[lookup["id"]] = lookup
+        key = (lookup["task_"], lookup["type_"])
+        cls._keys.setdefault(key, {})[lookup["id"]] = lookup["prompt_ids"]
+
+    @classmethod
+    def _remove_lookup(cls, lookup_id):
+        lookup = cls._lookups.pop(lookup_id, None)
+        if lookup:
+            cls._keys.get((lookup["task_"], lookup["type_"]), {}).pop(lookup_id, None)
+
+    @classmethod
+    def _put_prompt(cls, prompt):
+        prompt = {k: prompt[k] for k in PROMPT_COLS if k in prompt}
+        with cls._lock:
+            cls._prompts[prompt["id"]] = prompt
+        return prompt
+
+    @classmethod
+    def _scan_tables(cls):
+        """
+        _scan_tables lookups and prompts, projected to the indexed attributes
+        """
+        lookups = list(dynamodb.scan_iter(LOOKUP_TABLE, cols=LOOKUP_COLS))
+        prompts = list(dynamodb.scan_iter(PROMPTS_TABLE, cols=PROMPT_COLS))
+        return lookups, prompts
+
+    @classmethod
+    def _read_snapshot(cls, url):
+        """
+        _read_snapshot at url, None if missing, unreadable or too old
+        """
+        if not url:
+            return None
+        try:
+            with s3_open(url, "rb") as snapshot_file:
+                data = json.loads(gzip.decompress(snapshot_file.read()))
+        except (FileNotFoundError, OSError, ValueError) as e:
+            logger.warning("PromptIndex: no snapshot at %s: %s", url, e)
+            return None
+
+        age = time.time() - data.get("created_at", 0)
+        if PROMPT_INDEX_MAX_AGE and age > PROMPT_INDEX_MAX_AGE:
+            logger.info("PromptIndex: snapshot %s is %ds old, scanning", url, age)
+            return None
+        return data
+
+    @classmethod
+    def _streams_client(cls):
+        return get_client("dynamodbstreams")
+
+    @classmethod
+    def _open_streams(cls, iterator_type):
+        """
+        _open_streams iterators of both tables: LATEST of open shards, or
+        TRIM_HORIZON of all shards, closed ones included, to replay changes
+        """
+        streams = {}
+        for table in (LOOKUP_TABLE, PROMPTS_TABLE):
+            iterators = {}
+            try:
+                cls._add_shards(
+                    table, iterators, iterator_type, iterator_type == "TRIM_HORIZON"
+                )
+            except ClientError as e:
+                logger.warning("PromptIndex: no stream for %s: %s", table, e)
+            streams[table] = iterators
+        return streams
+
+    @classmethod
+    def _add_shards(cls, table, iterators, iterator_type, closed=False):
+        """
+        _add_shards iterators of table stream open shards (and closed ones
+        when closed) not in iterators
+        """
+        arn = (
+            dynamodb.db()
+            .describe_table(TableName=table)["Table"]
+            .get("LatestStreamArn")
+        )
+        if not arn:
+            logger.warning("PromptIndex: %s has no stream", table)
+            return
+        client = cls._streams_client()
+        request = {"StreamArn": arn}
+        while True:
+            description = client.describe_stream(**request)["StreamDescription"]
+            for shard in description["Shards"]:
+                shard_id = shard["ShardId"]
+                open_shard = "EndingSequenceNumber" not in shard.get(
+                    "SequenceNumberRange", {}
+                )
+                if (open_shard or closed) and shard_id not in iterators:
+                    if shard.get("ParentShardId"):
+                        cls._parents[shard_id] = shard["ParentShardId"]
+                    iterators[shard_id] = client.get_shard_iterator(
+                        StreamArn=arn, ShardId=shard_id, ShardIteratorType=iterator_type
+                    )["ShardIterator"]
+            if not description.get("LastEvaluatedShardId"):
+                return
+            request["ExclusiveStartShardId"] = description["LastEvaluatedShardId"]
+
+
+def _record_time(record):
+    """
+    _record_time ApproximateCreationDateTime of a stream record in epoch
+    seconds, a datetime from get_records or a number in lambda events
+    """
+    created = record.get("dynamodb", {}).get("ApproximateCreationDateTime", 0)
+    return created.timestamp() if hasattr(created, "timestamp") else created
@@ -1,14 +1,71 @@
 """
 prompt management (over dynamodb) utils for lambdas
 """
+import gzip
+import json
 import logging
+import os
 import time
 
 import dynamodb
-from misc_utils import hash_id, json_str
+from botocore.exceptions import ClientError
+from item_cache import ItemCache
+from misc_utils import JsonEncoder, hash_id, json_log
+from prompt_index import PromptIndex
+from s3 import s3_client, s3_download, s3_to_url, url_to_s3
+from ttl_sweeper import sweep_ttl
 
 logger = logging.getLogger(__name__)
 
+#
+# prompts rarely change: warm lambdas can serve them from ItemCache for
+# PROMPTS_CACHE_TTL seconds (0, the default, is off). The cache is per
+# container, writes from other containers show only once cached items expire
+#
+PROMPTS_CACHE_TTL = int(os.environ.get("PROMPTS_CACHE_TTL", 0))
+PROMPTS_CACHE_MAX_ITEMS = int(os.environ.get("PROMPTS_CACHE_MAX_ITEMS", 1024))
+
+if PROMPTS_CACHE_TTL > 0:
+    ItemCache.configure(
+        "prompts-table", ttl=PROMPTS_CACHE_TTL, max_items=PROMPTS_CACHE_MAX_ITEMS
+    )
+
+#
+# prompt results never change (ids are content hashes) until they expire:
+# get_prompt_results looks them up in memory (ItemCache, when
+# PROMPT_RESULTS_CACHE_TTL is set), then optionally in PROMPT_RESULTS_CACHE_DIR
+# files that outlive ItemCache in warm containers, then in prompt-results-table
+#
+PROMPT_RESULTS_CACHE_TTL = int(os.environ.get("PROMPT_RESULTS_CACHE_TTL", 0))
+PROMPT_RESULTS_CACHE_MAX_ITEMS = int(
+    os.environ.get("PROMPT_RESULTS_CACHE_MAX_ITEMS", 128)
+)
+PROMPT_RESULTS_CACHE_DIR = os.environ.get("PROMPT_RESULTS_CACHE_DIR", "")
+PROMPT_RESULTS_CACHE_MAX_FILES = int(
+    os.environ.get("PROMPT_RESULTS_CACHE_MAX_FILES", 1024)
+)
+
+if PROMPT_RESULTS_CACHE_TTL > 0:
+    ItemCache.configure(
+        "prompt-results-table",
+        ttl=PROMPT_RESULTS_CACHE_TTL,
+        max_items=PROMPT_RESULTS_CACHE_MAX_ITEMS,
+    )
+
+_results_files_written = 0
+
+#
+# results of PROMPT_RESULTS_OFFLOAD_SIZE bytes or more are stored gzipped in
+# PROMPT_RESULTS_BUCKET under their content hash, items keep a result_url
+# pointer instead, fetched only for the result get_prompt_results returns.
+# Objects should expire with an s3 lifecycle rule on PROMPT_RESULTS_PREFIX.
+#
+PROMPT_RESULTS_BUCKET = os.environ.get("PROMPT_RESULTS_BUCKET", "")
+PROMPT_RESULTS_PREFIX = os.environ.get("PROMPT_RESULTS_PREFIX", "prompt-results/")
+PROMPT_RESULTS_OFFLOAD_SIZE = int(
+    os.environ.get("PROMPT_RESULTS_OFFLOAD_SIZE", 32 * 1024)
+)
+
 
 def get_prompt(prompt_id):
     """
@@ -19,7 +76,7 @@ def get_prompt(prompt_id):
 
     table = "prompts-table"
     item = dynamodb.get_item(table, prompt_id)
-    logger.info("get prompt id=%s : %s", prompt_id, json_str(item))
+    logger.info("get prompt id=%s : %s", prompt_id, json_log(item))
     return item
 
 
@@ -36,6 +93,11 @@ def get_prompts(task_, type_, via_=None, do_random=True, do_limit=1):
         logger.error("get_prompts missing required type_")
         return None
 
+    if PromptIndex.enabled():
+        prompts = PromptIndex.get_prompts(task_, type_, via_, do_random, do_limit)
+        logger.debug("get_prompts indexed prompts: %s", json_log(prompts))
+        return prompts
+
     # dynamodb query arguments
     table = "prompt-lookup-table"
     index = "task-type"
@@ -58,18 +120,17 @@ def get_prompts(task_, type_, via_=None, do_random=True, do_limit=1):
     try:
         ids = [i["prompt_ids"] for i in items]
     except KeyError:
-        logger.error("get_prompts no ids found in response %s:", json_str(items))
+        logger.error("get_prompts no ids found in response %s:", json_log(items))
         ids = None
     else:
-        logger.debug("get_prompts ids: %s", json_str(ids))
+        logger.debug("get_prompts ids: %s", json_log(ids))
 
     table = "prompts-table"
-    prompts = (
-        dynamodb.get_items(table, ids, cols="id,template,actors,res_id")
-        if ids
-        else None
-    )
-    logger.debug("get_prompts prompts: %s", json_str(prompts))
+    prompts = None
+    if ids:
+        found = dynamodb.get_items(table, ids, cols="id,template,actors,res_id")
+        prompts = [prompt for prompt in found if prompt] or None
+    logger.debug("get_prompts prompts: %s", json_log(prompts))
 
     return prompts
 
@@ -86,8 +147,29 @@ def put_prompt_result(prompt_id, result, result_id=None, ttl=None):
     """
     cache prompt result for later us
     """
+    item = prompt_result_item(prompt_id, result, result_id, ttl)
+
+    logger.info("put_prompt_result item %s", json_log(item))
+    res = dynamodb.put_item("prompt-results-table", item)
+    logger.debug("put_prompt_result res: %s", json_log(res))
+    # to do: check for success
+    return item["id"]
 
-    result_id = result_id if result_id else hash_id(result)
+
+def prompt_result_item(prompt_id, result, result_id=None, ttl=None):
+    """
+    prompt_result_item for prompt-results-table, results larger than
+    PROMPT_RESULTS_OFFLOAD_SIZE are offloaded to s3 (see put_result_body)
+    """
+    body = None
+    if PROMPT_RESULTS_BUCKET and len(result) >= PROMPT_RESULTS_OFFLOAD_SIZE // 4:
+        # utf-8 is at most 4 bytes per char, encoded once for id and upload
+        body = result.encode("utf-8")
+        if len(body) < PROMPT_RESULTS_OFFLOAD_SIZE:
+            body = None
+
+    body_id = hash_id(body) if body is not None else None
+    result_id = result_id if result_id else (body_id or hash_id(result))
     created_at = int(time.time())
     ttl = ttl if ttl else (7 * 24 * 60 * 60)  # default ttl is one week
     ttl = created_at + ttl
@@ -95,43 +177,243 @@ def put_prompt_result(prompt_id, result, result_id=None, ttl=None):
     item = {
         "id": result_id,
         "prompt_id": prompt_id,
-        "result": result,
         "created_at": created_at,
         "ttl": ttl,
     }
+    if body is None:
+        item["result"] = result
+    else:
+        item["result_url"] = put_result_body(body, body_id)
+        item["result_size"] = len(body)
+    return item
 
-    logger.info("put_prompt_result item %s", json_str(item))
-    res = dynamodb.put_item("prompt-results-table", item)
-    logger.info("put_prompt_result res: %s", json_str(res))
-    # to do: check for success
+
+def put_result_body(body, body_id=None):
+    """
+    put_result_body gzipped into PROMPT_RESULTS_BUCKET under its content hash,
+    so identical bodies share one object whatever their result ids, returns
+    its s3 url. Rewriting an existing body restarts its lifecycle expiration.
+    """
+    key = f"{PROMPT_RESULTS_PREFIX}{body_id or hash_id(body)}.gz"
+    s3_client().put_object(
+        Bucket=PROMPT_RESULTS_BUCKET,
+        Key=key,
+        Body=gzip.compress(body, compresslevel=6),
+        ContentType="application/gzip",
+    )
+    logger.info("put_result_body %s: %d bytes", key, len(body))
+    return s3_to_url(PROMPT_RESULTS_BUCKET, key)
+
+
+def prompt_result_body(item):
+    """
+    prompt_result_body result of a prompt result item, inline or fetched from
+    its result_url (through S3ObjectCache, so repeated reads stay local)
+    """
+    if "result" in item:
+        return item["result"]
+    bucket, key = url_to_s3(item["result_url"])
+    local_path = s3_download(bucket, key)
+    if not local_path:
+        return None  # offloaded body is gone, treat as expired
+    with open(local_path, "rb") as body_file:
+        return gzip.decompress(body_file.read()).decode("utf-8")
+
+
+def add_prompt_result(prompt_id, result, result_id=None, ttl=None):
+    """
+    add_prompt_result puts the result and appends its id to the prompt res_id
+    list in one transaction, returns result_id, or None if prompt is missing.
+    A result already linked is rewritten only, with a fresh ttl.
+    """
+    item = prompt_result_item(prompt_id, result, result_id, ttl)
+    result_id = item["id"]
+    put = dynamodb.transact_put("prompt-results-table", item)
+    link = dynamodb.transact_update(
+        "prompts-table",
+        {"id": prompt_id},
+        "SET res_id = list_append(if_not_exists(res_id, :empty), :res_id)",
+        {":empty": [], ":res_id": [result_id], ":id": result_id, ":list": "L"},
+        # contains on a legacy res_id string would match substrings
+        condition="attribute_exists(id) AND (attribute_not_exists(res_id) OR "
+        "(attribute_type(res_id, :list) AND NOT contains(res_id, :id)))",
+    )
+
+    try:
+        dynamodb.transact_write([put, link])
+    except ClientError as e:
+        reasons = e.response.get("CancellationReasons") or [{}, {}]
+        if "Item" in reasons[1]:
+            # condition failed on an existing prompt: legacy space joined
+            # res_id string, or result already linked
+            return _relink_prompt_result(prompt_id, item, put)
+        if reasons[1].get("Code") == "ConditionalCheckFailed":
+            logger.error("add_prompt_result prompt %s not found", prompt_id)
+            return None
+        raise
+
+    logger.info("add_prompt_result %s -> %s", prompt_id, result_id)
     return result_id
 
 
+def _relink_prompt_result(prompt_id, item, put):
+    """
+    _relink_prompt_result rewrites the result, converting a legacy res_id
+    string to a list that includes it, unless the prompt changed meanwhile
+    """
+    ItemCache.invalidate("prompts-table", prompt_id)
+    prompt = dynamodb.get_item("prompts-table", prompt_id, cols="id,res_id")
+    if not prompt:
+        logger.error("add_prompt_result prompt %s not found", prompt_id)
+        return None
+
+    old = prompt.get("res_id")
+    res_ids = prompt_res_ids(prompt)
+    if item["id"] in res_ids and isinstance(old, list):
+        dynamodb.transact_write([put])
+        return item["id"]
+    if item["id"] not in res_ids:
+        res_ids.append(item["id"])
+
+    link = dynamodb.transact_update(
+        "prompts-table",
+        {"id": prompt_id},
+        "SET res_id = :res_ids",
+        {":res_ids": res_ids, ":old": old} if old else {":res_ids": res_ids},
+        condition="res_id = :old" if old else "attribute_not_exists(res_id)",
+    )
+    dynamodb.transact_write([put, link])
+    logger.info("add_prompt_result %s -> %s (relinked)", prompt_id, item["id"])
+    return item["id"]
+
+
+def prompt_res_ids(prompt):
+    """
+    prompt_res_ids list of result ids of prompt, res_id is a list, or a space
+    joined string in prompts written before add_prompt_result
+    """
+    res_id = (prompt or {}).get("res_id") or []
+    return res_id.split() if isinstance(res_id, str) else list(res_id)
+
+
 def get_prompt_results(res_ids):
     """
-    Place holder for prompt results cache: return a cache miss..
-    Do not invalidate any res_ids
+    get_prompt_results looks up all res_ids at once, memory and /tmp tiers
+    first, then one batched dynamodb call. Returns the result of the newest
+    valid, unexpired item (or None) and res_ids without the missing, expired
+    or invalid ids, in their original order.
     """
-    prompt_result = None
+    res_ids = list(res_ids or [])
+    if not res_ids:
+        return None, res_ids
     table = "prompt-results-table"
+    now = int(time.time())
 
-    while len(res_ids) > 0:
-        res_id = res_ids.pop()
-        item = dynamodb.get_item(table, res_id)  # , cols="result")
-        if item:
-            try:
-                prompt_result = item["result"]
-            except KeyError:
-                logger.error(
-                    "get_prompt_results invalid prompt result - %s",
-                    json_str(item),
-                )
-        break
+    items = {}
+    for res_id in res_ids:
+        item = ItemCache.get(table, res_id)
+        if item is None:
+            item = _results_file_get(res_id)
+            ItemCache.put(table, res_id, item)
+        if item is not None:
+            items[res_id] = item
+
+    missing = [res_id for res_id in res_ids if res_id not in items]
+    if missing:
+        for item in filter(None, dynamodb.get_items(table, missing) or []):
+            items[item["id"]] = item
+
+    valid = {}
+    for res_id, item in items.items():
+        if "result" not in item and "result_url" not in item:
+            logger.error("get_prompt_results invalid prompt result - %s", res_id)
+        elif item.get("ttl") and item["ttl"] <= now:
+            logger.debug("get_prompt_results expired %s", res_id)
+        else:
+            valid[res_id] = item
+            if res_id in missing:
+                _results_file_put(item)
+
+    # newest first, offloaded bodies are fetched only for the one returned
+    for item in sorted(
+        valid.values(), key=lambda item: item.get("created_at") or 0, reverse=True
+    ):
+        result = prompt_result_body(item)
+        if result is not None:
+            logger.info("get_prompt_results hit %s of %d", item["id"], len(res_ids))
+            return result, [res_id for res_id in res_ids if res_id in valid]
+        del valid[item["id"]]
+
+    logger.info("get_prompt_results miss %s", json_log(res_ids))
+    return None, []
+
+
+def _results_file_path(res_id):
+    """
+    _results_file_path of res_id, ids are url safe base64
+    """
+    return os.path.join(PROMPT_RESULTS_CACHE_DIR, f"{res_id}.json")
+
+
+def _results_file_get(res_id):
+    """
+    _results_file_get item from PROMPT_RESULTS_CACHE_DIR, None if missing
+    or expired
+    """
+    if not PROMPT_RESULTS_CACHE_DIR:
+        return None
+    path = _results_file_path(res_id)
+    try:
+        with open(path, encoding="utf8") as item_file:
+            item = json.load(item_file)
+    except (OSError, ValueError):
+        return None
+
+    if item.get("ttl") and item["ttl"] <= time.time():
+        _remove_results_file(path)
+        return None
+    return item
+
+
+def _results_file_put(item):
+    """
+    _results_file_put item into PROMPT_RESULTS_CACHE_DIR, dropping the oldest
+    half of the files beyond PROMPT_RESULTS_CACHE_MAX_FILES
+    """
+    global _results_files_written  # pylint: disable=global-statement
+    if not PROMPT_RESULTS_CACHE_DIR:
+        return
+    try:
+        os.makedirs(PROMPT_RESULTS_CACHE_DIR, exist_ok=True)
+        path = _results_file_path(item["id"])
+        with open(f"{path}.part", "w", encoding="utf8") as item_file:
+            json.dump(item, item_file, cls=JsonEncoder)
+        os.replace(f"{path}.part", path)
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning("get_prompt_results: could not cache %s: %s", item["id"], e)
+        return
+
+    _results_files_written += 1
+    if _results_files_written < PROMPT_RESULTS_CACHE_MAX_FILES:
+        return
+    with os.scandir(PROMPT_RESULTS_CACHE_DIR) as entries:
+        files = sorted(
+            (entry for entry in entries if entry.name.endswith(".json")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+    for entry in files[: len(files) - PROMPT_RESULTS_CACHE_MAX_FILES // 2]:
+        _remove_results_file(entry.path)
+    _results_files_written = PROMPT_RESULTS_CACHE_MAX_FILES // 2
 
-    if prompt_result:  # we had a good res_id! insert in list!
-        res_ids.insert(0, res_id)
 
-    return prompt_result, res_ids
+def _remove_results_file(path):
+    """
+    _remove_results_file ignoring races with other threads
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
 
 
 def update_prompt_results(prompt_id, res_ids):
@@ -140,8 +422,80 @@ def update_prompt_results(prompt_id, res_ids):
     """
     table = "prompts-table"
     key = {"id": prompt_id}
-    item = {"res_id": " ".join(res_ids)}
+    item = {"res_id": list(res_ids)}
 
     status = dynamodb.update_item(table, key, item)
-    logger.info("update_prompot_result status %s ", str(status))
+    logger.info("update_prompot_result status %s ", status)
     return status
+
+
+def sweep_expired_results(**kwargs):
+    """
+    sweep_expired_results deletes prompt results past their ttl (see
+    ttl_sweeper.sweep_ttl for kwargs) and prunes their ids from the res_id of
+    their prompts, returns stats. See sweep_expired_results_handler for a
+    scheduled lambda.
+    """
+    deleted, stats = sweep_ttl(
+        "prompt-results-table", cols=("id", "prompt_id"), **kwargs
+    )
+
+    expired = {}  # prompt id => expired result ids
+    for item in deleted:
+        if item.get("prompt_id"):
+            expired.setdefault(item["prompt_id"], set()).add(item["id"])
+    stats["prompts_pruned"] = prune_prompt_results(expired)
+    return stats
+
+
+SWEEP_EVENT_KWARGS = ("segments", "concurrency", "read_capacity", "write_capacity")
+
+
+def sweep_expired_results_handler(event, unused_context=None):
+    """
+    sweep_expired_results_handler lambda handler for a scheduled (cw_event)
+    sweep, event fields segments, concurrency, read_capacity and
+    write_capacity override the TTL_SWEEP_* settings, returns stats
+    """
+    event = event if isinstance(event, dict) else {}
+    kwargs = {k: event[k] for k in SWEEP_EVENT_KWARGS if event.get(k) is not None}
+    return sweep_expired_results(**kwargs)
+
+
+def prune_prompt_results(expired, max_attempts=3):
+    """
+    prune_prompt_results removes expired {prompt id: result ids} from prompts
+    res_id, conditioned on res_id being unchanged since read, returns the
+    number of prompts updated
+    """
+    pruned = 0
+    pending = dict(expired)
+    for _ in range(max_attempts):
+        if not pending:
+            break
+        found = dynamodb.get_items("prompts-table", list(pending), cols="id,res_id")
+        retry = {}
+        for prompt in filter(None, found or []):
+            res_ids = prompt_res_ids(prompt)
+            kept = [res_id for res_id in res_ids if res_id not in pending[prompt["id"]]]
+            if len(kept) == len(res_ids):
+                continue
+            try:
+                dynamodb.update_item(
+                    "prompts-table",
+                    {"id": prompt["id"]},
+                    {"res_id": kept},
+                    expected={"res_id": prompt["res_id"]},
+                )
+                pruned += 1
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    raise
+                # changed meanwhile, drop the cached res_id so the retry rereads it
+                ItemCache.invalidate("prompts-table", prompt["id"])
+                retry[prompt["id"]] = pending[prompt["id"]]
+        pending = retry
+
+    if pending:
+        logger.warning("prune_prompt_results: gave up on %d prompts", len(pending))
+    return pruned
@@ -2,25 +2,120 @@
 boto3 s3 utils for lambdas
 """
 
+import hashlib
+import io
+import json
 import logging
 import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from math import ceil
 
-import boto3
 import botocore
+from aws_clients import get_client, get_resource
+from boto3.s3.transfer import TransferConfig
 
 logging.getLogger("boto3").setLevel(logging.INFO)
 logging.getLogger("botocore").setLevel(logging.INFO)
 
 logger = logging.getLogger(__name__)
-s3_res = boto3.resource("s3")
-s3_client = boto3.client("s3")
 
+MB = 1024 * 1024
 
-def s3_download(bucket, key, local_path=None, force=False):
+#
+# Parallel ranged download tuning, overridable from the lambda environment
+# or per s3_download call. Objects smaller than the threshold are fetched
+# with a single GET, larger ones are split into chunk_size byte ranges that
+# are fetched by up to concurrency threads.
+#
+S3_DOWNLOAD_CHUNK_SIZE = int(os.environ.get("S3_DOWNLOAD_CHUNK_SIZE", 8 * MB))
+S3_DOWNLOAD_CONCURRENCY = int(os.environ.get("S3_DOWNLOAD_CONCURRENCY", 8))
+S3_DOWNLOAD_THRESHOLD = int(os.environ.get("S3_DOWNLOAD_THRESHOLD", 16 * MB))
+S3_READ_SIZE = 1 * MB
+
+#
+# s3_open streaming: readers fetch buffer_size ranges keeping read_ahead ranges
+# in flight, writers upload part_size multipart parts (s3 minimum is 5MB)
+# keeping up to concurrency parts in flight.
+#
+S3_STREAM_BUFFER_SIZE = int(os.environ.get("S3_STREAM_BUFFER_SIZE", 8 * MB))
+S3_STREAM_READ_AHEAD = int(os.environ.get("S3_STREAM_READ_AHEAD", 2))
+S3_STREAM_PART_SIZE = int(os.environ.get("S3_STREAM_PART_SIZE", 8 * MB))
+S3_STREAM_CONCURRENCY = int(os.environ.get("S3_STREAM_CONCURRENCY", 4))
+S3_MIN_PART_SIZE = 5 * MB
+
+#
+# s3_download object cache in lambda ephemeral storage: cached objects are
+# revalidated against their etag once older than max_age seconds (0 always
+# revalidates), least recently used objects are evicted beyond max_bytes.
+#
+S3_CACHE_DIR = os.environ.get("S3_CACHE_DIR", "/tmp")
+S3_CACHE_MAX_BYTES = int(os.environ.get("S3_CACHE_MAX_BYTES", 256 * MB))
+S3_CACHE_MAX_AGE = int(os.environ.get("S3_CACHE_MAX_AGE", 60))
+
+#
+# s3_download_many / s3_upload_many share one transfer pool, each call is
+# bounded to concurrency transfers in flight.
+# Uploads use a fixed multipart part size so remote etags can be predicted.
+#
+S3_TRANSFER_CONCURRENCY = int(os.environ.get("S3_TRANSFER_CONCURRENCY", 10))
+S3_UPLOAD_PART_SIZE = 8 * MB
+S3_UPLOAD_CONFIG = TransferConfig(
+    multipart_threshold=S3_UPLOAD_PART_SIZE, multipart_chunksize=S3_UPLOAD_PART_SIZE
+)
+
+#
+# s3_upload content addressed storage: content lives once under cas/<etag>,
+# callers record the returned content key, there are no alias copies.
+#
+S3_CAS_PREFIX = os.environ.get("S3_CAS_PREFIX", "cas")
+_transfer_pool = None
+_transfer_pool_lock = threading.Lock()
+
+
+def s3_client():
+    """
+    s3_client shared s3 client, built on first use
+    """
+    return get_client("s3")
+
+
+def s3_res():
+    """
+    s3_res s3 resource of the calling thread, built on first use
+    """
+    return get_resource("s3")
+
+
+def s3_download(
+    bucket,
+    key,
+    local_path=None,
+    force=False,
+    parallel=True,
+    chunk_size=None,
+    concurrency=None,
+    threshold=None,
+    cache=True,
+):
     """
     Download file from s3 bucket/key returns local path
+    parallel=True splits objects larger than threshold into byte ranges
+    cache=True keeps objects without local_path in S3ObjectCache
     """
 
+    if not local_path and cache:
+        return S3ObjectCache.get(
+            bucket,
+            key,
+            force=force,
+            chunk_size=chunk_size,
+            concurrency=concurrency,
+            threshold=threshold if parallel else float("inf"),
+        )
+
     if not local_path:
         local_path = f"/tmp/{bucket}/{key}"
 
@@ -32,11 +127,21 @@ def s3_download(bucket, key, local_path=None, force=False):
 
     try:
         os.makedirs(os.path.dirname(local_path), exist_ok=True)
-        s3_bucket = s3_res.Bucket(bucket)
-        s3_bucket.download_file(key, local_path)
+        if parallel:
+            s3_download_ranged(
+                bucket,
+                key,
+                local_path,
+                chunk_size=chunk_size,
+                concurrency=concurrency,
+                threshold=threshold,
+            )
+        else:
+            s3_bucket = s3_res().Bucket(bucket)
+            s3_bucket.download_file(key, local_path)
 
     except botocore.exceptions.ClientError as e:
-        if e.response["Error"]["Code"] == "404":
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
             logger.error("object does not exist at s3://%s/%s", bucket, key)
             local_path = None
         else:
@@ -47,6 +152,377 @@ def s3_download(bucket, key, local_path=None, force=False):
     return local_path
 
 
+def s3_download_ranged(
+    bucket,
+    key,
+    local_path,
+    size=None,
+    etag=None,
+    chunk_size=None,
+    concurrency=None,
+    threshold=None,
+):
+    """
+    s3_download_ranged fetches byte ranges of s3 object on a bounded thread pool
+    and writes them in place into a preallocated local file.
+    Ranges are pinned to the object etag so a concurrent overwrite fails the
+    download instead of mixing versions. Returns (local_path, size, etag)
+    """
+    chunk_size = chunk_size or S3_DOWNLOAD_CHUNK_SIZE
+    concurrency = concurrency or S3_DOWNLOAD_CONCURRENCY
+    threshold = threshold or S3_DOWNLOAD_THRESHOLD
+
+    if size is None or etag is None:
+        head = s3_client().head_object(Bucket=bucket, Key=key)
+        size = head["ContentLength"]
+        etag = head["ETag"]
+
+    ranges = [
+        (start, min(start + chunk_size, size) - 1)
+        for start in range(0, size, chunk_size)
+    ]
+    if size < threshold:
+        ranges = [(0, size - 1)] if size else []
+
+    logger.debug(
+        "s3_download_ranged: s3://%s/%s size %d in %d ranges",
+        bucket,
+        key,
+        size,
+        len(ranges),
+    )
+
+    part_path = _part_path(local_path)
+    fd = os.open(part_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.ftruncate(fd, size)  # preallocate, ranges are written in place
+
+        if len(ranges) > 1 and concurrency > 1:
+            with ThreadPoolExecutor(max_workers=min(concurrency, len(ranges))) as pool:
+                futures = [
+                    pool.submit(_download_range, fd, bucket, key, etag, first, last)
+                    for first, last in ranges
+                ]
+                for future in futures:
+                    future.result()  # re-raise worker errors
+        else:
+            for first, last in ranges:
+                _download_range(fd, bucket, key, etag, first, last)
+    except BaseException:
+        os.close(fd)
+        os.remove(part_path)
+        raise
+
+    os.close(fd)
+    os.replace(part_path, local_path)
+    return local_path, size, etag
+
+
+def _part_path(local_path):
+    """
+    _part_path unique temporary path next to local_path, renamed when complete
+    """
+    return f"{local_path}.{os.getpid()}.{threading.get_ident()}.part"
+
+
+def _download_body(body, local_path):
+    """
+    _download_body streams a get_object body into local_path
+    """
+    part_path = _part_path(local_path)
+    try:
+        with body, open(part_path, "wb") as part_file:
+            for data in iter(lambda: body.read(S3_READ_SIZE), b""):
+                part_file.write(data)
+    except BaseException:
+        os.remove(part_path)
+        raise
+    os.replace(part_path, local_path)
+    return local_path
+
+
+def _download_range(fd, bucket, key, etag, first, last):
+    """
+    _download_range streams bytes first..last (inclusive) into fd at offset first
+    """
+    res = s3_client().get_object(
+        Bucket=bucket, Key=key, Range=f"bytes={first}-{last}", IfMatch=etag
+    )
+    body = res["Body"]
+    offset = first
+    try:
+        for data in iter(lambda: body.read(S3_READ_SIZE), b""):
+            offset += os.pwrite(fd, data, offset)
+    finally:
+        body.close()
+
+    if offset != last + 1:
+        raise IOError(
+            f"short read s3://{bucket}/{key} range {first}-{last} at {offset}"
+        )
+
+
+class S3ObjectCache:
+    """
+    S3ObjectCache etag validated, size bounded LRU cache of s3 objects kept at
+    /tmp/{bucket}/{key}. The index survives in ephemeral storage between
+    warm invocations and sandbox restarts.
+    """
+
+    _lock = threading.RLock()
+    _entries = None  # OrderedDict url => {path, etag, size, validated_at}, LRU first
+    _index_path = os.path.join(S3_CACHE_DIR, "S3ObjectCache_index.json")
+    _max_bytes = S3_CACHE_MAX_BYTES
+    _max_age = S3_CACHE_MAX_AGE
+    _stats = {
+        "hits": 0,
+        "misses": 0,
+        "revalidations": 0,
+        "updates": 0,
+        "evictions": 0,
+        "bytes_downloaded": 0,
+    }
+
+    def __init__(self):
+        """
+        singlton __init__ is forbidden
+        """
+        raise RuntimeError("Singleton, use methods directly")
+
+    @classmethod
+    def configure(cls, max_bytes=None, max_age=None):
+        """
+        configure byte budget and revalidation age, evicting down to budget
+        """
+        with cls._lock:
+            if max_bytes is not None:
+                cls._max_bytes = max_bytes
+            if max_age is not None:
+                cls._max_age = max_age
+            cls._load_index()
+            if cls._evict():
+                cls._store_index()
+
+    @classmethod
+    def local_path(cls, bucket, key):
+        """
+        local_path of cached s3 object
+        """
+        return os.path.join(S3_CACHE_DIR, bucket, key)
+
+    @classmethod
+    def get(cls, bucket, key, force=False, **download_kwargs):
+        """
+        get local path of s3 object, downloading or revalidating as needed.
+        Returns None for missing objects.
+        """
+        url = f"s3://{bucket}/{key}"
+        local_path = cls.local_path(bucket, key)
+
+        with cls._lock:
+            cls._load_index()
+            entry = cls._entries.get(url)
+            if entry and not os.path.exists(entry["path"]):
+                entry = None
+            if entry:
+                cls._entries.move_to_end(url)
+
+        if force:
+            entry = None
+        elif entry and time.time() - entry["validated_at"] < cls._max_age:
+            cls._count("hits")
+            logger.info("S3ObjectCache: hit %s", url)
+            return entry["path"]
+
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        try:
+            if entry:
+                entry = cls._revalidate(bucket, key, entry, **download_kwargs)
+            else:
+                cls._count("misses")
+                logger.info("S3ObjectCache: miss %s", url)
+                _, size, etag = s3_download_ranged(
+                    bucket, key, local_path, **download_kwargs
+                )
+                cls._count("bytes_downloaded", size)
+                entry = {"path": local_path, "etag": etag, "size": size}
+
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                logger.error("object does not exist at %s", url)
+                cls.invalidate(bucket, key)
+                return None
+            logger.error(str(e))
+            raise
+
+        entry["validated_at"] = time.time()
+        with cls._lock:
+            cls._entries[url] = entry
+            cls._entries.move_to_end(url)
+            cls._evict(keep=url)
+            cls._store_index()
+        return entry["path"]
+
+    @classmethod
+    def lookup(cls, bucket, key):
+        """
+        lookup cache entry {path, etag, size, validated_at} without validation
+        """
+        url = f"s3://{bucket}/{key}"
+        with cls._lock:
+            cls._load_index()
+            entry = cls._entries.get(url)
+        if entry and os.path.exists(entry["path"]):
+            return entry
+        return None
+
+    @classmethod
+    def invalidate(cls, bucket, key):
+        """
+        invalidate drops s3 object from cache
+        """
+        url = f"s3://{bucket}/{key}"
+        with cls._lock:
+            cls._load_index()
+            entry = cls._entries.pop(url, None)
+            if entry:
+                cls._remove_file(entry["path"])
+                cls._store_index()
+
+    @classmethod
+    def clear(cls):
+        """
+        clear drops all cached objects
+        """
+        with cls._lock:
+            cls._load_index()
+            for entry in cls._entries.values():
+                cls._remove_file(entry["path"])
+            cls._entries.clear()
+            cls._store_index()
+
+    @classmethod
+    def size(cls):
+        """
+        size in bytes of cached objects
+        """
+        with cls._lock:
+            cls._load_index()
+            return sum(entry["size"] for entry in cls._entries.values())
+
+    @classmethod
+    def stats(cls):
+        """
+        stats counters since container start (or reset_stats)
+        """
+        with cls._lock:
+            stats = dict(cls._stats)
+        stats["bytes_cached"] = cls.size()
+        return stats
+
+    @classmethod
+    def reset_stats(cls):
+        """
+        reset_stats counters
+        """
+        with cls._lock:
+            for name in cls._stats:
+                cls._stats[name] = 0
+
+    @classmethod
+    def _revalidate(cls, bucket, key, entry, **download_kwargs):
+        """
+        _revalidate with a conditional GET, downloading only if etag changed
+        """
+        url = f"s3://{bucket}/{key}"
+        try:
+            res = s3_client().get_object(
+                Bucket=bucket, Key=key, IfNoneMatch=entry["etag"]
+            )
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] not in ("304", "NotModified"):
+                raise
+            cls._count("revalidations")
+            logger.info("S3ObjectCache: not modified %s", url)
+            return entry
+
+        cls._count("updates")
+        logger.info("S3ObjectCache: modified %s", url)
+        size = res["ContentLength"]
+        etag = res["ETag"]
+        threshold = download_kwargs.get("threshold") or S3_DOWNLOAD_THRESHOLD
+        if size >= threshold:
+            res["Body"].close()  # large object, fetch ranges in parallel instead
+            s3_download_ranged(
+                bucket, key, entry["path"], size=size, etag=etag, **download_kwargs
+            )
+        else:
+            _download_body(res["Body"], entry["path"])
+
+        cls._count("bytes_downloaded", size)
+        return {"path": entry["path"], "etag": etag, "size": size}
+
+    @classmethod
+    def _evict(cls, keep=None):
+        """
+        _evict least recently used objects beyond byte budget
+        """
+        total = sum(entry["size"] for entry in cls._entries.values())
+        evicted = False
+        for url in list(cls._entries):
+            if total <= cls._max_bytes:
+                break
+            if url == keep:
+                continue
+            entry = cls._entries.pop(url)
+            cls._remove_file(entry["path"])
+            total -= entry["size"]
+            cls._stats["evictions"] += 1
+            evicted = True
+            logger.info("S3ObjectCache: evict %s (%d bytes)", url, entry["size"])
+        return evicted
+
+    @classmethod
+    def _count(cls, name, value=1):
+        with cls._lock:
+            cls._stats[name] += value
+
+    @classmethod
+    def _remove_file(cls, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @classmethod
+    def _load_index(cls):
+        """
+        _load_index once per container from ephemeral storage
+        """
+        if cls._entries is not None:
+            return
+
+        cls._entries = OrderedDict()
+        try:
+            with open(cls._index_path, "r", encoding="utf8") as index_file:
+                for url, entry in json.load(index_file):
+                    cls._entries[url] = entry
+        except FileNotFoundError:
+            logger.info("S3ObjectCache: no index in lambda's ephemeral storage")
+        except (json.JSONDecodeError, ValueError) as e:
+            logger.error("S3ObjectCache: index load error: %s", str(e))
+
+    @classmethod
+    def _store_index(cls):
+        """
+        _store_index in LRU order, atomically replacing the previous one
+        """
+        part_path = _part_path(cls._index_path)
+        with open(part_path, "w", encoding="utf8") as index_file:
+            json.dump(list(cls._entries.items()), index_file)
+        os.replace(part_path, cls._index_path)
+
+
 def s3_download_url(url, local_path=None, force=False):
     """
     s3_download_url
@@ -55,47 +531,648 @@ def s3_download_url(url, local_path=None, force=False):
     return s3_download(bucket, key, local_path, force)
 
 
-def s3_upload(local_path, bucket, key=None, force=False):
+def s3_upload(
+    local_path, bucket, key=None, force=False, dedup=True, content_addressed=False
+):
     """
-    s3_upload
+    s3_upload skips the upload (dedup=True) when the object at key already
+    has the local file content, compared by multipart compatible etag.
+    content_addressed=True ignores key and stores the content once under
+    cas/<etag>, so retried jobs never re-upload identical outputs; callers
+    keep the returned content key.
     """
     if not key:
         key = os.path.basename(local_path)
 
-    # is
-    exists = False  # True
+    if content_addressed:
+        return s3_upload_content_addressed(local_path, bucket, force)
 
-    # try:
-    #    if not force: # skip exist check if force
-    #        s3.head_object(Bucket=bucket, Key=key)
-    #
-    # except botocore.exceptions.ClientError as e:
-    #    if e.response['Error']['Code'] == "404":
-    #        exists = False
-    # else:
-    #  # Something else has gone wrong.
-    #  raise e
-
-    if not exists or force:
+    exists = False
+    if dedup and not force:  # skip exist check if force
+        obj = _head_or_none(bucket, key)
+        exists = bool(obj) and s3_etag_matches(local_path, obj["Size"], obj["ETag"])
+
+    if exists:
+        logger.info("s3_upload: s3://%s/%s unchanged, skipped", bucket, key)
+    else:
         with open(local_path, "rb") as data:
-            s3_client.upload_fileobj(Fileobj=data, Bucket=bucket, Key=key)
+            s3_client().upload_fileobj(
+                Fileobj=data, Bucket=bucket, Key=key, Config=S3_UPLOAD_CONFIG
+            )
 
     return bucket, key
 
 
-def s3_upload_url(local_path, url, force=False):
+def s3_upload_content_addressed(local_path, bucket, force=False):
+    """
+    s3_upload_content_addressed uploads local file to cas/<etag> unless that
+    content is already stored. Returns bucket, content key
+    """
+    etag = s3_etag(local_path)
+    content_key = S3_CAS_PREFIX + "/" + etag.strip('"')
+
+    content = None if force else _head_or_none(bucket, content_key)
+    if content and (
+        content["ETag"] == etag
+        or s3_etag_matches(local_path, content["Size"], content["ETag"])
+    ):
+        logger.info("s3_upload: content s3://%s/%s exists", bucket, content_key)
+    else:
+        with open(local_path, "rb") as data:
+            s3_client().upload_fileobj(
+                Fileobj=data, Bucket=bucket, Key=content_key, Config=S3_UPLOAD_CONFIG
+            )
+    return bucket, content_key
+
+
+def s3_upload_url(local_path, url, force=False, **kwargs):
     """
     s3_upload_url
     """
     bucket, key = url_to_s3(url)
-    return s3_upload(local_path, bucket, key, force)
+    return s3_upload(local_path, bucket, key, force, **kwargs)
+
+
+def s3_list(bucket, prefix=""):
+    """
+    s3_list yields {Key, Size, ETag} of all objects under prefix
+    """
+    paginator = s3_client().get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            yield obj
+
+
+def s3_etag(local_path, part_size=None, multipart=None):
+    """
+    s3_etag computes the s3 ETag of local file as uploaded with part_size
+    multipart parts: md5 for a single put, md5 of part md5s-N for multipart,
+    even of one part. multipart defaults to what S3_UPLOAD_CONFIG does, files
+    of part_size or more are uploaded in parts. Hashed S3_READ_SIZE at a time.
+    """
+    part_size = part_size or S3_UPLOAD_PART_SIZE
+    if multipart is None:
+        multipart = os.path.getsize(local_path) >= part_size
+
+    digest = hashlib.md5()
+    digests = []
+    with open(local_path, "rb") as local_file:
+        while True:
+            part = hashlib.md5()
+            remaining = part_size
+            while remaining:
+                data = local_file.read(min(S3_READ_SIZE, remaining))
+                if not data:
+                    break
+                digest.update(data)
+                part.update(data)
+                remaining -= len(data)
+            if remaining == part_size:
+                break  # end of file
+            digests.append(part.digest())
+            if remaining:
+                break
+
+    if not multipart:
+        return f'"{digest.hexdigest()}"'
+
+    digest = hashlib.md5(b"".join(digests)).hexdigest()
+    return f'"{digest}-{len(digests)}"'
+
+
+def s3_etag_matches(local_path, size, etag):
+    """
+    s3_etag_matches checks local file against remote size and etag.
+    Multipart etags do not record part size, so common part sizes are tried.
+    """
+    try:
+        if os.path.getsize(local_path) != size:
+            return False
+    except FileNotFoundError:
+        return False
+
+    etag = etag.strip('"')
+    if "-" not in etag:
+        return s3_etag(local_path, multipart=False).strip('"') == etag
+
+    parts = int(etag.split("-")[1])
+    candidates = [S3_UPLOAD_PART_SIZE, S3_STREAM_PART_SIZE, S3_DOWNLOAD_CHUNK_SIZE]
+    candidates.append(ceil(size / parts / MB) * MB)
+    for part_size in dict.fromkeys(candidates):  # unique, in order
+        if max(ceil(size / part_size), 1) != parts:
+            continue
+        if s3_etag(local_path, part_size, multipart=True).strip('"') == etag:
+            return True
+    return False
+
+
+def s3_download_many(
+    items, local_dir=None, force=False, sync=False, concurrency=None, **kwargs
+):
+    """
+    s3_download_many downloads items, a list of (bucket, key, local_path) or
+    an s3://bucket/prefix url, on the shared transfer pool.
+    Prefix objects go to local_dir/<key relative to prefix>, or into
+    S3ObjectCache without local_dir.
+    sync=True skips objects whose local size and etag already match.
+    Returns per item results in input (or listing) order:
+        {"bucket", "key", "local_path", "status", "error"}
+    status is one of downloaded, skipped, missing, error
+    """
+    listed = {}
+    if isinstance(items, str):
+        bucket, prefix = url_to_s3(items)
+        objects = list(s3_list(bucket, prefix))
+        items = []
+        for obj in objects:
+            rel_path = obj["Key"][len(prefix) :].lstrip("/")
+            local_path = os.path.join(local_dir, rel_path) if local_dir else None
+            items.append((bucket, obj["Key"], local_path))
+            listed[(bucket, obj["Key"])] = obj
+
+    def download_one(bucket, key, local_path):
+        res = {"bucket": bucket, "key": key, "local_path": local_path}
+        obj = listed.get((bucket, key))
+        if sync and not force:
+            obj = obj or _head_or_none(bucket, key)
+            if obj is None:
+                res["status"] = "missing"
+                return res
+            if local_path:
+                skip = s3_etag_matches(local_path, obj["Size"], obj["ETag"])
+            else:
+                entry = S3ObjectCache.lookup(bucket, key)
+                skip = entry and entry["etag"] == obj["ETag"]
+                res["local_path"] = entry["path"] if skip else None
+            if skip:
+                res["status"] = "skipped"
+                return res
+
+        if obj and local_path:
+            # listed size and etag save s3_download a head_object per object
+            try:
+                os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+                s3_download_ranged(
+                    bucket, key, local_path, obj["Size"], obj["ETag"], **kwargs
+                )
+            except botocore.exceptions.ClientError as e:
+                if e.response["Error"]["Code"] not in ("404", "NoSuchKey"):
+                    raise
+                local_path = None
+            res["local_path"] = local_path
+        else:
+            res["local_path"] = s3_download(
+                bucket, key, local_path, force=force or sync, **kwargs
+            )
+        res["status"] = "downloaded" if res["local_path"] else "missing"
+        return res
+
+    results = _transfer_many(download_one, items, concurrency)
+    for item, res in zip(items, results):
+        if "error" in res:
+            res.update({"bucket": item[0], "key": item[1], "local_path": item[2]})
+
+    _log_transfer_results("s3_download_many", results)
+    return results
+
+
+def s3_upload_many(items, url=None, force=False, sync=False, concurrency=None):
+    """
+    s3_upload_many uploads items, a list of (local_path, bucket, key) or
+    a local directory uploaded under s3://bucket/prefix url, on the shared
+    transfer pool.
+    sync=True skips objects whose remote size and etag already match.
+    Returns per item results in input (or directory walk) order:
+        {"bucket", "key", "local_path", "status", "error"}
+    status is one of uploaded, skipped, error
+    """
+    listed = {}
+    if isinstance(items, str):
+        if not url:
+            raise ValueError("s3_upload_many of a directory requires a url")
+        local_dir = items
+        bucket, prefix = url_to_s3(url)
+        items = []
+        for root, _, filenames in os.walk(local_dir):
+            for name in sorted(filenames):
+                local_path = os.path.join(root, name)
+                rel_path = os.path.relpath(local_path, local_dir)
+                key = prefix.rstrip("/") + "/" + rel_path if prefix else rel_path
+                items.append((local_path, bucket, key))
+        if sync:
+            listed = {(bucket, o["Key"]): o for o in s3_list(bucket, prefix)}
+
+    def upload_one(local_path, bucket, key):
+        res = {"bucket": bucket, "key": key, "local_path": local_path}
+        if sync and not force:
+            obj = listed.get((bucket, key))
+            if obj is None and not listed:
+                obj = _head_or_none(bucket, key)
+            if obj and s3_etag_matches(local_path, obj["Size"], obj["ETag"]):
+                res["status"] = "skipped"
+                return res
+
+        s3_upload(local_path, bucket, key, force=True)
+        res["status"] = "uploaded"
+        return res
+
+    results = _transfer_many(upload_one, items, concurrency)
+    for item, res in zip(items, results):
+        if "error" in res:
+            res.update({"bucket": item[1], "key": item[2], "local_path": item[0]})
+
+    _log_transfer_results("s3_upload_many", results)
+    return results
+
+
+def s3_sync(src, dst, concurrency=None):
+    """
+    s3_sync s3://bucket/prefix into local directory, or local directory into
+    s3://bucket/prefix, transferring only objects that differ
+    """
+    if src.startswith("s3://"):
+        return s3_download_many(src, local_dir=dst, sync=True, concurrency=concurrency)
+    return s3_upload_many(src, url=dst, sync=True, concurrency=concurrency)
+
+
+def _head_or_none(bucket, key):
+    """
+    _head_or_none returns {Size, ETag} of s3 object or None if missing
+    """
+    try:
+        head = s3_client().head_object(Bucket=bucket, Key=key)
+    except botocore.exceptions.ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            return None
+        raise
+    return {
+        "Size": head["ContentLength"],
+        "ETag": head["ETag"],
+        "Metadata": head.get("Metadata", {}),
+    }
+
+
+def _get_transfer_pool():
+    """
+    _get_transfer_pool lazily creates the transfer pool shared by all calls
+    """
+    global _transfer_pool  # pylint: disable=global-statement
+    with _transfer_pool_lock:
+        if _transfer_pool is None:
+            _transfer_pool = ThreadPoolExecutor(
+                max_workers=S3_TRANSFER_CONCURRENCY,
+                thread_name_prefix="s3-transfer",
+            )
+    return _transfer_pool
+
+
+def _transfer_many(transfer_one, items, concurrency=None):
+    """
+    _transfer_many runs transfer_one(*item) for all items on the shared pool,
+    at most concurrency at a time. Errors are returned per item, not raised.
+    """
+    concurrency = concurrency or S3_TRANSFER_CONCURRENCY
+    pool = _get_transfer_pool()
+    slots = threading.BoundedSemaphore(concurrency)
+
+    def run(item):
+        try:
+            return transfer_one(*item)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error("transfer %s failed: %s", item, str(e))
+            return {"status": "error", "error": str(e)}
+        finally:
+            slots.release()
+
+    futures = []
+    for item in items:
+        slots.acquire()  # bound in flight (and queued) transfers
+        futures.append(pool.submit(run, item))
+    return [future.result() for future in futures]
+
+
+def _log_transfer_results(name, results):
+    counts = {}
+    for res in results:
+        counts[res["status"]] = counts.get(res["status"], 0) + 1
+    logger.info("%s: %d items %s", name, len(results), counts)
+
+
+def s3_open(url, mode="rb", encoding="utf-8", **kwargs):
+    """
+    s3_open returns a file-like object streaming s3 object at url,
+    without staging it in /tmp. mode is one of r, rb, w, wb.
+    Reading a missing object raises FileNotFoundError.
+
+        with s3_open("s3://bucket/manifest.json", "r") as fp:
+            manifest = json.load(fp)
+    """
+    if mode not in ("r", "rb", "w", "wb"):
+        raise ValueError(f"unsupported s3_open mode: {mode}")
+
+    bucket, key = url_to_s3(url)
+    logger.info("s3_open: s3://%s/%s mode %s", bucket, key, mode)
+
+    if mode.startswith("r"):
+        raw = S3Reader(bucket, key, **kwargs)
+        stream = io.BufferedReader(raw, buffer_size=S3_READ_SIZE)
+    else:
+        raw = S3Writer(bucket, key, **kwargs)
+        stream = S3BufferedWriter(raw, buffer_size=S3_READ_SIZE)
+
+    if "b" in mode:
+        return stream
+    if mode == "w":
+        return S3TextWriter(stream, encoding=encoding)
+    return io.TextIOWrapper(stream, encoding=encoding)
+
+
+class S3Reader(io.RawIOBase):
+    """
+    S3Reader seekable raw stream over an s3 object, reading ahead ranges in
+    a background thread while the caller consumes the current range
+    """
+
+    def __init__(self, bucket, key, buffer_size=None, read_ahead=None):
+        super().__init__()
+        self.bucket = bucket
+        self.key = key
+        self.buffer_size = buffer_size or S3_STREAM_BUFFER_SIZE
+        self.read_ahead = S3_STREAM_READ_AHEAD if read_ahead is None else read_ahead
+
+        try:
+            head = s3_client().head_object(Bucket=bucket, Key=key)
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                raise FileNotFoundError(f"s3://{bucket}/{key}") from e
+            raise
+
+        self.size = head["ContentLength"]
+        self.etag = head["ETag"]
+
+        self._pos = 0
+        self._buffer = b""
+        self._buffer_start = 0
+        self._pending = deque()  # (start, future) of ranges being read ahead
+        self._pool = (
+            ThreadPoolExecutor(max_workers=self.read_ahead) if self.read_ahead else None
+        )
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self._pos = offset
+        return self._pos
+
+    def readinto(self, buffer):
+        if self._pos >= self.size:
+            return 0
+
+        offset = self._pos - self._buffer_start
+        if not 0 <= offset < len(self._buffer):
+            self._fill(self._pos)
+            offset = self._pos - self._buffer_start
+
+        count = min(len(buffer), len(self._buffer) - offset)
+        buffer[:count] = self._buffer[offset : offset + count]
+        self._pos += count
+        return count
+
+    def close(self):
+        if not self.closed:
+            for _, future in self._pending:
+                future.cancel()
+            self._pending.clear()
+            if self._pool:
+                self._pool.shutdown(wait=True)
+            self._buffer = b""
+        super().close()
+
+    def _fill(self, pos):
+        """
+        _fill loads the range starting at pos, from read ahead when sequential
+        """
+        while self._pending and self._pending[0][0] != pos:
+            _, future = self._pending.popleft()
+            future.cancel()  # reader seeked away, drop stale read ahead
+
+        if self._pending:
+            _, future = self._pending.popleft()
+            data = future.result()
+        else:
+            data = self._get_range(pos)
+
+        self._buffer = data
+        self._buffer_start = pos
+
+        if self._pool:
+            next_start = self._pending[-1][0] if self._pending else pos
+            while len(self._pending) < self.read_ahead:
+                next_start += self.buffer_size
+                if next_start >= self.size:
+                    break
+                future = self._pool.submit(self._get_range, next_start)
+                self._pending.append((next_start, future))
+
+    def _get_range(self, start):
+        last = min(start + self.buffer_size, self.size) - 1
+        res = s3_client().get_object(
+            Bucket=self.bucket,
+            Key=self.key,
+            Range=f"bytes={start}-{last}",
+            IfMatch=self.etag,
+        )
+        with res["Body"] as body:
+            return body.read()
+
+
+class S3Writer(io.RawIOBase):
+    """
+    S3Writer raw stream uploading to s3 as a multipart upload, part_size bytes
+    at a time. Objects smaller than one part are uploaded with a single put.
+    The upload is completed on close, unless discarded (or aborted) first.
+    """
+
+    def __init__(self, bucket, key, part_size=None, concurrency=None, **extra_args):
+        super().__init__()
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(part_size or S3_STREAM_PART_SIZE, S3_MIN_PART_SIZE)
+        self.concurrency = concurrency or S3_STREAM_CONCURRENCY
+        self.extra_args = extra_args  # ContentType, Metadata, ...
+        self.size = 0
+        self.etag = None
+
+        self._buffer = bytearray()
+        self._discarded = False
+        self._upload_id = None
+        self._parts = []  # futures of {"PartNumber", "ETag"}
+        self._pool = None
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError("write to closed S3Writer")
+        if self._discarded:
+            return len(data)
+
+        self._buffer += data
+        self.size += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._upload_part(bytes(self._buffer[: self.part_size]))
+            del self._buffer[: self.part_size]
+        return len(data)
+
+    def discard(self):
+        """
+        discard marks the upload to be aborted on close, later writes are dropped
+        """
+        self._discarded = True
+        self._buffer = bytearray()
+
+    def abort(self):
+        """
+        abort drops the upload, nothing is written to s3
+        """
+        self.discard()
+        self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._discarded:
+                self._abort_upload()
+            else:
+                self._complete_upload()
+        except BaseException:
+            self._abort_upload()
+            raise
+        finally:
+            self._buffer = bytearray()
+            if self._pool:
+                self._pool.shutdown(wait=True)
+            super().close()
+
+    def _complete_upload(self):
+        if self._upload_id is None:
+            res = s3_client().put_object(
+                Bucket=self.bucket,
+                Key=self.key,
+                Body=bytes(self._buffer),
+                **self.extra_args,
+            )
+        else:
+            if self._buffer:
+                self._upload_part(bytes(self._buffer))
+            parts = [future.result() for future in self._parts]
+            res = s3_client().complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self._upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        self.etag = res["ETag"]
+        logger.info(
+            "S3Writer: s3://%s/%s %d bytes etag %s",
+            self.bucket,
+            self.key,
+            self.size,
+            self.etag,
+        )
+
+    def _abort_upload(self):
+        """
+        _abort_upload best effort, failures are logged so they never hide the
+        error that caused the abort (an AbortIncompleteMultipartUpload
+        lifecycle rule cleans up uploads left behind)
+        """
+        if self._upload_id is None:
+            return
+        for future in self._parts:
+            future.cancel()
+        wait(self._parts)  # parts uploaded after the abort would leak storage
+        logger.warning("S3Writer: abort upload s3://%s/%s", self.bucket, self.key)
+        try:
+            s3_client().abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self._upload_id
+            )
+        except (botocore.exceptions.ClientError, botocore.exceptions.BotoCoreError):
+            logger.exception(
+                "S3Writer: abort upload s3://%s/%s failed", self.bucket, self.key
+            )
+        self._upload_id = None
+
+    def _upload_part(self, data):
+        if self._upload_id is None:
+            res = s3_client().create_multipart_upload(
+                Bucket=self.bucket, Key=self.key, **self.extra_args
+            )
+            self._upload_id = res["UploadId"]
+            self._pool = ThreadPoolExecutor(max_workers=self.concurrency)
+
+        # bound memory: wait for oldest part before queuing more than concurrency
+        in_flight = [future for future in self._parts if not future.done()]
+        if len(in_flight) >= self.concurrency:
+            in_flight[0].result()
+
+        part_number = len(self._parts) + 1
+        future = self._pool.submit(self._put_part, part_number, data)
+        self._parts.append(future)
+
+    def _put_part(self, part_number, data):
+        res = s3_client().upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=data,
+        )
+        return {"PartNumber": part_number, "ETag": res["ETag"]}
+
+
+class S3BufferedWriter(io.BufferedWriter):
+    """
+    S3BufferedWriter discards the s3 upload when its with block raises
+    """
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.raw.discard()
+        return super().__exit__(exc_type, exc_value, traceback)
+
+
+class S3TextWriter(io.TextIOWrapper):
+    """
+    S3TextWriter discards the s3 upload when its with block raises
+    """
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.buffer.raw.discard()
+        return super().__exit__(exc_type, exc_value, traceback)
 
 
 def s3_to_url(bucket, key):
     """
     s3_to_url
     """
-    if bucket.contains("/"):
+    if "/" in bucket:
         raise ValueError(f"bucket should not include the / character ({bucket})")
 
     return f"s3://{bucket}/{key}"
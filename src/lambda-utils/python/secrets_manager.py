@@ -5,9 +5,9 @@ import json
 import logging
 import os
 
-import boto3
+from aws_clients import get_client
 from botocore.exceptions import ClientError
-from misc_utils import json_str
+from misc_utils import json_log
 
 logging.getLogger("boto3").setLevel(logging.WARNING)
 logging.getLogger("botocore").setLevel(logging.WARNING)
@@ -22,7 +22,6 @@ class SecretManager:
 
     _instance = None
     _region = os.environ["AWS_REGION"]
-    _session = boto3.session.Session()
     _secret_manager = None
     _secrets_cache = {}
     _cache_path = "/tmp/SecretManager_secrets_cache.json"
@@ -44,9 +43,7 @@ class SecretManager:
         if cls._instance is None:
             logger.debug("cls. new instance")
             cls._instance = cls.__new__(cls)
-            cls._secret_manager = cls._session.client(
-                service_name="secretsmanager", region_name=cls._region
-            )
+            cls._secret_manager = get_client("secretsmanager", region_name=cls._region)
             cls.load_cache()
         else:
             logger.debug("cls._instance found!")
@@ -70,7 +67,7 @@ class SecretManager:
         logger.debug(
             "SecretManager.get_secret secret_value %s cache %s",
             secret_value,
-            json_str(cls._secrets_cache),
+            json_log(cls._secrets_cache),
         )
         return secret_value
 
@@ -145,7 +142,7 @@ class SecretManager:
         except json.JSONDecodeError as e:
             logger.error("load_cache JSONDecodeError: %s", str(e))
         else:
-            logger.info("load_cache: cache %s", json_str(cls._secrets_cache))
+            logger.info("load_cache: cache %s", json_log(cls._secrets_cache))
 
     @classmethod
     def store_cache(cls):
@@ -153,7 +150,7 @@ class SecretManager:
         save_cache
         """
         logger.debug(
-            "store_cache: %s << %s", cls._cache_path, json_str(cls._secrets_cache)
+            "store_cache: %s << %s", cls._cache_path, json_log(cls._secrets_cache)
         )
 
         with open(cls._cache_path, "w", encoding="utf8") as cache_file:
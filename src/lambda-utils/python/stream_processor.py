@@ -0,0 +1,156 @@
+"""
+batched dynamodb stream processing
+
+A stream batch is grouped by item key, each key's records are coalesced into
+one change (old image before the batch, latest new image) and the keys are
+dispatched concurrently, each key's changes in stream order:
+
+    lambda_handler = stream_handler(apply_change)
+
+    def apply_change(change):
+        if change.event_name == "REMOVE": ...
+
+With ReportBatchItemFailures on the event source mapping, the handler reports
+the failed keys' records (see batch_handler.batch_item_failures), and the
+retry resumes at the earliest of them instead of replaying the whole batch.
+Records after it, of keys that succeeded, are replayed too, so changes should
+be applied idempotently.
+"""
+import logging
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import dynamodb
+from batch_handler import batch_item_failures, run_job
+from events import arn_to_table
+
+logger = logging.getLogger(__name__)
+
+STREAM_CONCURRENCY = int(os.environ.get("STREAM_CONCURRENCY", 8))
+
+StreamChange = namedtuple(
+    "StreamChange",
+    ["table", "keys", "event_name", "old_image", "new_image", "sequence_numbers"],
+)
+StreamChange.__doc__ = """
+coalesced change of one item: its table and keys, INSERT / MODIFY / REMOVE,
+images before and after (None if missing) and its records' sequence numbers
+"""
+
+
+def record_key(record):
+    """
+    record_key hashable (table, keys) of a stream record, None if malformed
+    """
+    keys = record.get("dynamodb", {}).get("Keys")
+    if not keys:
+        return None
+    return (
+        arn_to_table(record.get("eventSourceARN")),
+        tuple(sorted((name, str(value)) for name, value in keys.items())),
+    )
+
+
+def group_records(records):
+    """
+    group_records {(table, keys): [records]} in stream order, keys in order
+    of first appearance; malformed records are logged and dropped
+    """
+    groups = {}
+    for record in records:
+        key = record_key(record) if isinstance(record, dict) else None
+        if key is None:
+            logger.error("group_records: record without keys skipped")
+            continue
+        groups.setdefault(key, []).append(record)
+    return groups
+
+
+def coalesce_records(records):
+    """
+    coalesce_records StreamChange of an item's records: an INSERT followed
+    by MODIFYs stays an INSERT, else the last event name. None if an INSERT
+    is followed by a REMOVE, the item neither existed before nor after.
+    """
+    first, last = records[0], records[-1]
+    event_name = last.get("eventName")
+    if first.get("eventName") == "INSERT" and event_name == "REMOVE":
+        return None
+    if first.get("eventName") == "INSERT" and event_name == "MODIFY":
+        event_name = "INSERT"
+    old_image = first.get("dynamodb", {}).get("OldImage")
+    new_image = last.get("dynamodb", {}).get("NewImage")
+    if event_name == "REMOVE":
+        new_image = None
+    return StreamChange(
+        table=arn_to_table(last.get("eventSourceARN")),
+        keys=dynamodb.deserialize_item(last["dynamodb"]["Keys"]),
+        event_name=event_name,
+        old_image=dynamodb.deserialize_item(old_image) if old_image else None,
+        new_image=dynamodb.deserialize_item(new_image) if new_image else None,
+        sequence_numbers=[
+            record["dynamodb"].get("SequenceNumber") for record in records
+        ],
+    )
+
+
+def process_stream_batch(event, handler, coalesce=True, concurrency=None):
+    """
+    process_stream_batch calls handler with the StreamChange of each item of
+    the event's records (of each record if not coalesce), items concurrently
+    on concurrency threads (STREAM_CONCURRENCY). A change fails if handler
+    raises or returns a dict with an "error" (see batch_handler.run_job), and
+    stops its item's later changes. Returns batch_handler.batch_item_failures
+    of the failed changes' records and the records after them.
+    """
+    records = (event or {}).get("Records") or []
+    groups = list(group_records(records).values())
+    concurrency = min(concurrency or STREAM_CONCURRENCY, len(groups)) or 1
+
+    def run(group):
+        return _process_group(group, handler, coalesce)
+
+    if concurrency <= 1:
+        failed = [run(group) for group in groups]
+    else:
+        with ThreadPoolExecutor(concurrency, thread_name_prefix="stream") as pool:
+            failed = list(pool.map(run, groups))
+
+    failed_ids = {id(record) for group_failed in failed for record in group_failed}
+    response = batch_item_failures(
+        records, [id(record) not in failed_ids for record in records]
+    )
+    logger.info(
+        "process_stream_batch: %d records %d items, %d failed",
+        len(records),
+        len(groups),
+        sum(1 for group_failed in failed if group_failed),
+    )
+    return response
+
+
+def _process_group(records, handler, coalesce):
+    """
+    _process_group applies an item's changes in order, returns the records
+    of the failed change and of the changes after it, [] on success
+    """
+    batches = [records] if coalesce else [[record] for record in records]
+    for index, batch in enumerate(batches):
+        change = coalesce_records(batch)
+        if change is None:
+            continue  # inserted and removed within the batch
+        if not run_job(handler, change):
+            return [record for later in batches[index:] for record in later]
+    return []
+
+
+def stream_handler(handler, coalesce=True, concurrency=None):
+    """
+    stream_handler lambda handler of process_stream_batch with handler
+    """
+
+    def lambda_handler(event, unused_context=None):
+        return process_stream_batch(event, handler, coalesce, concurrency)
+
+    return lambda_handler
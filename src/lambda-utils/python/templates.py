@@ -0,0 +1,176 @@
+"""
+precompiled prompt template rendering
+
+Templates use str.format named fields, {subject} or {score:.2f}, with {{ and
+}} escapes (no positional, attribute or index fields). A template is parsed
+once into a render plan, literal parts with slots for its fields, cached by
+prompt id and template hash, so rendering is a join of the literals with the
+substituted values.
+
+    text = render_prompt(prompt, {"subject": "a cat"}, actor="poet")
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from string import Formatter
+
+logger = logging.getLogger(__name__)
+
+PROMPT_TEMPLATE_CACHE_SIZE = int(os.environ.get("PROMPT_TEMPLATE_CACHE_SIZE", 256))
+
+_formatter = Formatter()
+_lock = threading.Lock()
+_plans = OrderedDict()  # (prompt id, template hash) => TemplatePlan, LRU first
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+class TemplatePlan:
+    """
+    TemplatePlan compiled render plan of a template
+    """
+
+    __slots__ = ("template", "parts", "slots", "fields")
+
+    def __init__(self, template):
+        self.template = template
+        self.parts = []  # literals, with None slots for fields
+        self.slots = []  # (part index, field name, conversion, format spec)
+        for literal, field, spec, conversion in _formatter.parse(template):
+            if literal:
+                self.parts.append(literal)
+            if field is None:
+                continue
+            if not field.isidentifier() or "{" in spec:
+                raise ValueError(f"template: field {{{field}}} not supported")
+            self.slots.append((len(self.parts), field, conversion, spec))
+            self.parts.append(None)
+        self.fields = frozenset(slot[1] for slot in self.slots)
+
+    def render(self, values, strict=True):
+        """
+        render template with values {field: value}; strict=False leaves
+        fields without values as they are, else raises KeyError
+        """
+        parts = self.parts.copy()
+        for index, field, conversion, spec in self.slots:
+            if field in values:
+                parts[index] = _format_value(values[field], conversion, spec)
+            elif strict:
+                raise KeyError(field)
+            else:
+                parts[index] = _field_text(field, conversion, spec)
+        return "".join(parts)
+
+    def render_many(self, values_list, strict=True):
+        """
+        render_many one text per values dict of values_list
+        """
+        return [self.render(values, strict) for values in values_list]
+
+
+def _format_value(value, conversion, spec):
+    if conversion == "r":
+        value = repr(value)
+    elif conversion == "a":
+        value = ascii(value)
+    elif conversion == "s":
+        value = str(value)
+    if spec:
+        return format(value, spec)
+    return value if isinstance(value, str) else format(value)
+
+
+def _field_text(field, conversion, spec):
+    conversion = f"!{conversion}" if conversion else ""
+    spec = f":{spec}" if spec else ""
+    return f"{{{field}{conversion}{spec}}}"
+
+
+def compile_template(template, prompt_id=None):
+    """
+    compile_template plan of template, cached by prompt_id and template hash
+    """
+    cache_key = (prompt_id, hash(template))
+    with _lock:
+        plan = _plans.get(cache_key)
+        if plan is not None and plan.template == template:
+            _plans.move_to_end(cache_key)
+            _stats["hits"] += 1
+            return plan
+        _stats["misses"] += 1
+
+    plan = TemplatePlan(template)
+    with _lock:
+        _plans[cache_key] = plan
+        _plans.move_to_end(cache_key)
+        while len(_plans) > PROMPT_TEMPLATE_CACHE_SIZE:
+            _plans.popitem(last=False)
+            _stats["evictions"] += 1
+    logger.debug("compile_template %s: %d fields", prompt_id, len(plan.slots))
+    return plan
+
+
+def prompt_actors(prompt):
+    """
+    prompt_actors list of a prompt's actors, a list or a space joined string
+    """
+    actors = (prompt or {}).get("actors") or []
+    return actors.split() if isinstance(actors, str) else list(actors)
+
+
+def render_prompt(prompt, args=None, actor=None, strict=True):
+    """
+    render_prompt template of a get_prompts prompt with args, and {actor}
+    set to actor (default the prompt's first actor)
+    """
+    plan = compile_template(prompt["template"], prompt.get("id"))
+    return plan.render(_prompt_values(prompt, args, actor), strict)
+
+
+def render_many(prompt, args_list, actor=None, strict=True):
+    """
+    render_many one text per args dict of args_list, from one plan
+    """
+    plan = compile_template(prompt["template"], prompt.get("id"))
+    if "actor" not in plan.fields:
+        return plan.render_many(args_list, strict)
+    return plan.render_many(
+        [_prompt_values(prompt, args, actor) for args in args_list], strict
+    )
+
+
+def render_actors(prompt, args=None, strict=True):
+    """
+    render_actors {actor: text} for each of the prompt's actors
+    """
+    plan = compile_template(prompt["template"], prompt.get("id"))
+    return {
+        actor: plan.render(_prompt_values(prompt, args, actor), strict)
+        for actor in prompt_actors(prompt)
+    }
+
+
+def _prompt_values(prompt, args, actor):
+    values = dict(args or {})
+    if "actor" not in values:
+        actor = actor or next(iter(prompt_actors(prompt)), None)
+        if actor is not None:
+            values["actor"] = actor
+    return values
+
+
+def template_cache_stats():
+    """
+    template_cache_stats hits, misses, evictions and size
+    """
+    with _lock:
+        return dict(_stats, plans=len(_plans))
+
+
+def clear_template_cache():
+    """
+    clear_template_cache drops all compiled plans
+    """
+    with _lock:
+        _plans.clear()
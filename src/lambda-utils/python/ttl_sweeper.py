@@ -0,0 +1,95 @@
+"""
+sweeper of expired (past ttl) dynamodb items
+
+dynamodb ttl deletion can lag expiry by days, while expired items are still
+returned by reads. sweep_ttl deletes them with a parallel segmented scan
+filtered on ttl < now and batched deletes, paced to a capacity budget.
+"""
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import dynamodb
+
+logger = logging.getLogger(__name__)
+
+TTL_SWEEP_SEGMENTS = int(os.environ.get("TTL_SWEEP_SEGMENTS", 8))
+TTL_SWEEP_CONCURRENCY = int(os.environ.get("TTL_SWEEP_CONCURRENCY", 4))
+# capacity units per second, 0 is unlimited
+TTL_SWEEP_READ_CAPACITY = float(os.environ.get("TTL_SWEEP_READ_CAPACITY", 0))
+TTL_SWEEP_WRITE_CAPACITY = float(os.environ.get("TTL_SWEEP_WRITE_CAPACITY", 0))
+
+
+def sweep_ttl(
+    table,
+    ttl_attr="ttl",
+    cols=("id",),
+    segments=None,
+    concurrency=None,
+    read_capacity=None,
+    write_capacity=None,
+    now=None,
+):
+    """
+    sweep_ttl deletes table items whose ttl_attr is before now, scanning
+    segments in parallel on concurrency threads, within read_capacity and
+    write_capacity units per second. Returns the deleted items projected to
+    cols (which must include the "id" key) and stats.
+    """
+    segments = segments or TTL_SWEEP_SEGMENTS
+    concurrency = min(concurrency or TTL_SWEEP_CONCURRENCY, segments)
+    read_capacity = TTL_SWEEP_READ_CAPACITY if read_capacity is None else read_capacity
+    write_capacity = (
+        TTL_SWEEP_WRITE_CAPACITY if write_capacity is None else write_capacity
+    )
+    now = int(now or time.time())
+    reads = dynamodb.CapacityBudget(read_capacity) if read_capacity else None
+    writes = dynamodb.CapacityBudget(write_capacity) if write_capacity else None
+
+    started = time.time()
+    with ThreadPoolExecutor(concurrency, thread_name_prefix="ttl-sweep") as pool:
+        results = list(
+            pool.map(
+                lambda segment: _sweep_segment(
+                    table, ttl_attr, cols, segment, segments, now, reads, writes
+                ),
+                range(segments),
+            )
+        )
+
+    deleted = [item for items, _ in results for item in items]
+    stats = {"deleted": len(deleted), "segments": segments}
+    for _, segment_stats in results:
+        for name, value in segment_stats.items():
+            stats[name] = stats.get(name, 0) + value
+    for name, budget in (("read", reads), ("write", writes)):
+        if budget:
+            stats[f"{name}_capacity"] = budget.consumed
+            stats[f"{name}_waited"] = budget.waited
+    stats["seconds"] = time.time() - started
+
+    logger.info("sweep_ttl %s: %s", table, stats)
+    return deleted, stats
+
+
+def _sweep_segment(table, ttl_attr, cols, segment, segments, now, reads, writes):
+    """
+    _sweep_segment scans and deletes the expired items of one segment
+    """
+    deleted = []
+    with dynamodb.BatchWriter(table, budget=writes) as writer:
+        for db_item in dynamodb.scan_pages(
+            table,
+            cols=cols,
+            filter_="#ttl < :now",
+            names={"#ttl": ttl_attr},
+            values={":now": now},
+            segment=segment,
+            total_segments=segments,
+            budget=reads,
+        ):
+            item = dynamodb.deserialize_item(db_item)
+            writer.delete_item({"id": item["id"]})
+            deleted.append(item)
+    return deleted, writer.stats